@@ -5,7 +5,7 @@ a = Analysis(
     ['game.py'],
     pathex=[],
     binaries=[],
-    datas=[('images', 'images')],
+    datas=[('images', 'images'), ('rules.json', '.')],
     hiddenimports=[],
     hookspath=[],
     hooksconfig={},
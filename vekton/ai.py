@@ -0,0 +1,217 @@
+"""Компьютерные противники: план хода каждой фракции считается в отдельном процессе.
+
+Планировщик получает снимок партии (байты сохранения; между ходами
+дописываются только новые здания), перебирает
+наборы построек и найма по таблицам стоимости, содержания и производства
+и укладывается в бюджет времени. Главный поток в это время продолжает
+рисовать, а готовые планы применяет по порядку номеров фракций.
+"""
+import time
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+
+from gamelog import get_logger
+from replay import BUILD, RECRUIT
+from savegame import Snapshotter, parse_game
+
+log = get_logger("ai")
+
+# Время на план одной фракции, с, и сколько ждать результата сверх него
+AI_TIME_BUDGET = 0.5
+AI_RESULT_GRACE = 5.0
+
+# Поиск: ходов вперед для оценки, действий за ход, вариантов на каждом шаге
+PLAN_HORIZON = 20
+MAX_ACTIONS = 4
+BEAM_WIDTH = 6
+
+# Оценка плана: доход в ход ценится как столько единиц запасов, юнит - как столько
+INCOME_VALUE = 30
+UNIT_VALUE = 20
+
+# Клетки для построек ищутся вокруг базы фракции, ближние - первыми
+PLACEMENT_RADIUS = 30
+PLACEMENT_OFFSETS = sorted(
+    ((dx, dy) for dx in range(-PLACEMENT_RADIUS, PLACEMENT_RADIUS + 1)
+     for dy in range(-PLACEMENT_RADIUS, PLACEMENT_RADIUS + 1)),
+    key=lambda offset: (offset[0] * offset[0] + offset[1] * offset[1], offset)
+)
+
+# Базы противников - по углам карты, начиная с дальнего от начала координат
+HOME_CORNERS = [(0.75, 0.75), (0.75, 0.25), (0.25, 0.75), (0.25, 0.25)]
+
+def faction_home(world, owner):
+    """Клетка, вокруг которой фракция строится"""
+    fx, fy = HOME_CORNERS[(owner - 1) % len(HOME_CORNERS)]
+    return int(world.width * fx), int(world.height * fy)
+
+def free_cells(world, owner):
+    """Свободные клетки у базы фракции: {тип клетки или None: [клетки по удаленности]}"""
+    home_x, home_y = faction_home(world, owner)
+    cells = {}
+    for dx, dy in PLACEMENT_OFFSETS:
+        cell = (home_x + dx, home_y + dy)
+        if not world.in_bounds(cell) or world.index.building_at(cell):
+            continue
+        tile = world.tile_at(cell)
+        cells.setdefault(tile.kind if tile else None, []).append(cell)
+    return cells
+
+def score(world, stock, counts, units):
+    """Оценка положения: запасы через PLAN_HORIZON ходов, доход и юниты"""
+    stock = list(stock)
+    income = [0] * len(stock)
+    for kind, count in counts.items():
+        for i, amount in enumerate(world.building_production.get(kind, ())):
+            income[i] += amount * count
+        for i, amount in enumerate(world.building_upkeep.get(kind, ())):
+            income[i] -= amount * count
+
+    for _ in range(PLAN_HORIZON):
+        # Содержание - сколько зданий каждого типа удается оплатить
+        for kind, count in counts.items():
+            upkeep = world.building_upkeep.get(kind)
+            if upkeep:
+                paid = min([count] + [stock[i] // amount for i, amount in enumerate(upkeep) if amount])
+                for i, amount in enumerate(upkeep):
+                    stock[i] -= amount * paid
+        for kind, count in counts.items():
+            for i, amount in enumerate(world.building_production.get(kind, ())):
+                stock[i] += amount * count
+    return sum(stock) + INCOME_VALUE * sum(income) + UNIT_VALUE * units
+
+def plan_turn(snapshot, owner, time_budget=AI_TIME_BUDGET):
+    """План хода фракции owner по снимку партии: список команд (код, x, y, аргумент).
+
+    Лучевой поиск по последовательностям действий до MAX_ACTIONS за ход;
+    при нехватке времени возвращается лучший из уже найденных планов.
+    """
+    deadline = time.perf_counter() + time_budget
+    world = parse_game(snapshot)
+    faction = world.factions[owner]
+    cells = free_cells(world, owner)
+    recruiters = [
+        building for building in world.buildings
+        if building.owner == owner and world.building_recruits.get(building.kind)
+    ]
+
+    def actions(stock, used):
+        """Доступные действия: постройка типа kind или найм юнита в здании"""
+        for kind, cost in world.building_costs.items():
+            terrain = world.building_terrain.get(kind)
+            if used.get(terrain, 0) < len(cells.get(terrain, ())) and all(h >= n for h, n in zip(stock, cost)):
+                yield (BUILD, kind, cost)
+        for building in recruiters:
+            for unit_kind in world.building_recruits[building.kind]:
+                cost = world.unit_costs[unit_kind]
+                if all(h >= n for h, n in zip(stock, cost)):
+                    yield (RECRUIT, (building.x, building.y, unit_kind), cost)
+
+    start = (list(faction.stock), dict(faction.economy.counts), 0, {}, [])
+    best_score = score(world, start[0], start[1], 0)
+    best_plan = []
+    beam = [start]
+    for _ in range(MAX_ACTIONS):
+        candidates = []
+        for stock, counts, units, used, plan in beam:
+            for op, target, cost in actions(stock, used):
+                if time.perf_counter() > deadline:
+                    break
+                new_stock = [have - need for have, need in zip(stock, cost)]
+                new_counts, new_units, new_used = counts, units, used
+                if op == BUILD:
+                    new_counts = dict(counts)
+                    new_counts[target] = new_counts.get(target, 0) + 1
+                    terrain = world.building_terrain.get(target)
+                    new_used = dict(used)
+                    new_used[terrain] = new_used.get(terrain, 0) + 1
+                else:
+                    new_units = units + 1
+                value = score(world, new_stock, new_counts, new_units)
+                candidates.append((value, (new_stock, new_counts, new_units, new_used, plan + [(op, target)])))
+        if not candidates:
+            break
+        candidates.sort(key=lambda candidate: candidate[0], reverse=True)
+        if candidates[0][0] > best_score:
+            best_score, best_plan = candidates[0][0], candidates[0][1][4]
+        beam = [state for _, state in candidates[:BEAM_WIDTH]]
+        if time.perf_counter() > deadline:
+            break
+
+    # Действия плана -> команды с клетками
+    moves = []
+    taken = {}
+    for op, target in best_plan:
+        if op == BUILD:
+            terrain = world.building_terrain.get(target)
+            index = taken.get(terrain, 0)
+            taken[terrain] = index + 1
+            x, y = cells[terrain][index]
+            moves.append((BUILD, x, y, target))
+        else:
+            x, y, unit_kind = target
+            moves.append((RECRUIT, x, y, unit_kind))
+    return moves
+
+class AIController:
+    """Планирование ходов противников в пуле процессов без блокировки интерфейса"""
+
+    def __init__(self, owners, time_budget=AI_TIME_BUDGET):
+        self.owners = list(owners)
+        self.time_budget = time_budget
+        self.executor = None
+        self.futures = {}
+        self.deadline = None
+        self.snapshotter = Snapshotter()
+
+    def start_turn(self, world):
+        """Запуск планирования по снимку партии; результат - через poll()"""
+        if not self.owners:
+            return
+        snapshot = self.snapshotter.dump(world)
+        try:
+            if self.executor is None:
+                self.executor = ProcessPoolExecutor(max_workers=len(self.owners))
+            self.futures = {
+                owner: self.executor.submit(plan_turn, snapshot, owner, self.time_budget) for owner in self.owners
+            }
+        except (OSError, BrokenProcessPool) as e:
+            log.error("Не удалось запустить процессы противников: %s", e)
+            self.executor = None
+            self.futures = {}
+            return
+        self.deadline = time.perf_counter() + self.time_budget + AI_RESULT_GRACE
+
+    def thinking(self):
+        return bool(self.futures)
+
+    def poll(self):
+        """Готовые планы [(фракция, команды)] по порядку фракций или None, пока они считаются.
+
+        Планы, не успевшие к сроку, пропускаются - фракция в этот ход ничего не делает.
+        """
+        if not self.futures:
+            return None
+        if not all(future.done() for future in self.futures.values()) and time.perf_counter() < self.deadline:
+            return None
+
+        plans = []
+        for owner in sorted(self.futures):
+            future = self.futures[owner]
+            if not future.done():
+                log.warning("Противник %d не успел спланировать ход", owner, extra={"event": "ai_timeout", "data": {"faction": owner}})
+                continue
+            try:
+                plans.append((owner, future.result()))
+            except Exception as e:
+                log.error("Ошибка планирования противника %d: %s", owner, e, extra={"event": "ai_error", "data": {"faction": owner}})
+                if isinstance(e, BrokenProcessPool):
+                    self.executor = None
+        self.futures = {}
+        return plans
+
+    def close(self):
+        if self.executor:
+            self.executor.shutdown(wait=False, cancel_futures=True)
+            self.executor = None
+        self.futures = {}
@@ -0,0 +1,279 @@
+"""Замеры производительности игры без окна.
+
+Запуск:
+    python benchmark.py --output bench_results.json
+
+Для каждой пары (размер карты, количество зданий) измеряются:
+скорость строительства, ходов в секунду, время кадра каждого draw_*
+и память. Результаты пишутся в JSON, чтобы сравнивать прогоны между собой.
+"""
+import argparse
+import json
+import os
+import platform
+import random
+import sys
+import tempfile
+import time
+import tracemalloc
+
+# Видеодрайвер должен быть выбран до инициализации pygame
+os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
+os.environ.setdefault("SDL_AUDIODRIVER", "dummy")
+
+import pygame
+
+from game import Game, GAME_SCREEN
+from savegame import load_game, save_game
+from state import GameState, BUILDING_IDS, BUILDING_TERRAIN, TERRAIN_NAMES
+
+MAP_SIZES = [(1024, 576), (1900, 1000), (3840, 2160)]
+BUILDING_COUNTS = [0, 100, 1000, 5000]
+STATE_BUILDING_COUNTS = [1000, 10000, 100000]
+# Карта больше экрана: время кадра должно зависеть от видимой части, а не от размера мира
+BIG_WORLD_SIZE = (500, 500)
+
+DRAW_METHODS = [
+    "draw_main_menu",
+    "draw_game_screen",
+    "draw_resource_panel",
+    "draw_mol_menu",
+    "draw_settings_menu",
+]
+
+# Шахта для каждого типа ресурса на клетке
+MINES = {terrain: building for building, terrain in BUILDING_TERRAIN.items()}
+
+def fill_buildings(game, count):
+    """Застройка всей карты (а не только экрана) через try_build_building, пока есть место"""
+    world = game.world
+    world.resources = [10 ** 9] * len(world.resources)
+    # Ресурсы создаются заранее, чтобы в замер строительства не попала генерация карты
+    world.generate_all()
+
+    cells = [(x, y) for x in range(world.width) for y in range(world.height)]
+    random.shuffle(cells)
+    building_types = list(game.building_costs)
+
+    calls = 0
+    start = time.perf_counter()
+    for cell in cells:
+        if len(world.buildings) >= count:
+            break
+        building_type = random.choice(building_types)
+        tile = world.tile_at(cell)
+        if tile:
+            # Ставим подходящую шахту на клетку с ресурсом
+            building_type = MINES.get(TERRAIN_NAMES[tile.kind], building_type)
+        # Клетка вне экрана - точка за его краем, камера не двигается
+        game.try_build_building(game.cell_to_screen(cell), building_type)
+        calls += 1
+    elapsed = time.perf_counter() - start
+
+    placed = len(world.buildings)
+    return {
+        "requested": count,
+        "placed": placed,
+        "calls": calls,
+        "calls_per_sec": calls / elapsed if elapsed else None,
+        "builds_per_sec": placed / elapsed if elapsed else None,
+    }
+
+def measure_turns(game, turns):
+    """Ходов в секунду для end_turn"""
+    start = time.perf_counter()
+    for _ in range(turns):
+        game.end_turn()
+    elapsed = time.perf_counter() - start
+    return {
+        "turns": turns,
+        "turns_per_sec": turns / elapsed if elapsed else None,
+        "ms_per_turn": elapsed * 1000 / turns,
+    }
+
+def measure_draw(game, frames):
+    """Среднее время кадра каждого метода отрисовки, мс"""
+    game.state = GAME_SCREEN
+    results = {}
+    for name in DRAW_METHODS:
+        method = getattr(game, name)
+        method()
+        start = time.perf_counter()
+        for _ in range(frames):
+            method()
+        elapsed = time.perf_counter() - start
+        results[name] = elapsed * 1000 / frames
+    return results
+
+def run_case(size, building_count, turns, frames, seed, world_size=None):
+    """Один замер: экран заданного размера с заданным числом зданий"""
+    random.seed(seed)
+    tracemalloc.start()
+    game = Game(headless=True, size=size, world_size=world_size, seed=seed, autosave=False, replay=False, ai_factions=0)
+    build = fill_buildings(game, building_count)
+    _, setup_peak = tracemalloc.get_traced_memory()
+
+    turn_stats = measure_turns(game, turns)
+    draw_stats = measure_draw(game, frames)
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    return {
+        "map_size": list(size),
+        "world_size": [game.world.width, game.world.height],
+        "cell_size": game.cell_size,
+        "resources": len(game.world.tiles),
+        "buildings": len(game.world.buildings),
+        "build": build,
+        "end_turn": turn_stats,
+        "draw_ms": draw_stats,
+        "memory": {
+            "setup_peak_bytes": setup_peak,
+            "current_bytes": current,
+            "peak_bytes": peak,
+        },
+        "text_cache": game.text_cache.stats(),
+    }
+
+def measure_startup(size):
+    """Время от создания игры до первого кадра: без кэша картинок, с пустым и с заполненным кэшем"""
+    def first_frame(**kwargs):
+        start = time.perf_counter()
+        game = Game(headless=True, size=size, autosave=False, replay=False, ai_factions=0, **kwargs)
+        game.draw_main_menu()
+        pygame.display.flip()
+        return (time.perf_counter() - start) * 1000
+
+    results = {"no_cache_ms": first_frame(image_cache=False)}
+    previous = os.environ.get("VEKTOR_CACHE_DIR")
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["VEKTOR_CACHE_DIR"] = cache_dir
+        try:
+            results["cold_cache_ms"] = first_frame()
+            results["warm_cache_ms"] = first_frame()
+        finally:
+            if previous is None:
+                del os.environ["VEKTOR_CACHE_DIR"]
+            else:
+                os.environ["VEKTOR_CACHE_DIR"] = previous
+    return results
+
+def run_state_case(building_count, turns, seed):
+    """Замер одного состояния игры, без pygame и без ограничения размером экрана"""
+    rng = random.Random(seed)
+    tracemalloc.start()
+    side = int(building_count ** 0.5) + 2
+    world = GameState(side + 2, side + 2, seed=seed)
+    start = time.perf_counter()
+    world.generate_all()
+    generate_elapsed = time.perf_counter() - start
+    tiles_bytes, _ = tracemalloc.get_traced_memory()
+
+    world.resources = [10 ** 9] * len(world.resources)
+    free_kinds = [kind for name, kind in BUILDING_IDS.items() if name not in BUILDING_TERRAIN]
+    start = time.perf_counter()
+    for x in range(1, side + 1):
+        for y in range(1, side + 1):
+            if len(world.buildings) >= building_count:
+                break
+            tile = world.index.tile_at((x, y))
+            if tile:
+                name = MINES.get(TERRAIN_NAMES[tile.kind])
+                if name is None:
+                    continue
+                kind = BUILDING_IDS[name]
+            else:
+                kind = rng.choice(free_kinds)
+            world.build((x, y), kind)
+    build_elapsed = time.perf_counter() - start
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    start = time.perf_counter()
+    for _ in range(turns):
+        world.end_turn()
+    elapsed = time.perf_counter() - start
+
+    with tempfile.TemporaryDirectory() as save_dir:
+        path = os.path.join(save_dir, "bench.vks")
+        start = time.perf_counter()
+        save_game(world, path)
+        save_elapsed = time.perf_counter() - start
+        save_bytes = os.path.getsize(path)
+        start = time.perf_counter()
+        load_game(path)
+        load_elapsed = time.perf_counter() - start
+
+    buildings = len(world.buildings)
+    return {
+        "tiles": len(world.tiles),
+        "generate_ms": generate_elapsed * 1000,
+        "buildings": buildings,
+        "builds_per_sec": buildings / build_elapsed if build_elapsed else None,
+        "turns_per_sec": turns / elapsed if elapsed else None,
+        "bytes_per_building": (current - tiles_bytes) / buildings if buildings else None,
+        "bytes_per_tile": tiles_bytes / len(world.tiles) if world.tiles else None,
+        "save_ms": save_elapsed * 1000,
+        "load_ms": load_elapsed * 1000,
+        "save_bytes": save_bytes,
+    }
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Замеры производительности vektor без окна")
+    parser.add_argument("--output", default="bench_results.json", help="файл для результатов (JSON)")
+    parser.add_argument("--turns", type=int, default=200, help="ходов на каждый замер")
+    parser.add_argument("--frames", type=int, default=30, help="кадров на каждый метод отрисовки")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--quick", action="store_true", help="только маленькая карта")
+    args = parser.parse_args(argv)
+
+    # Картинки ищутся относительно папки игры
+    os.chdir(os.path.dirname(os.path.abspath(__file__)))
+
+    sizes = MAP_SIZES[:1] if args.quick else MAP_SIZES
+    counts = BUILDING_COUNTS[:2] if args.quick else BUILDING_COUNTS
+
+    cases = []
+    runs = [(size, count, None) for size in sizes for count in counts]
+    runs += [(size, counts[-1], BIG_WORLD_SIZE) for size in sizes]
+    for size, count, world_size in runs:
+        result = run_case(size, count, args.turns, args.frames, args.seed, world_size)
+        cases.append(result)
+        world_width, world_height = result['world_size']
+        placed = result['build']['placed']
+        print(f"{size[0]}x{size[1]}, карта {world_width}x{world_height}, зданий {placed}"
+              f"{'' if placed == count else f' (из {count} - нет места)'}: "
+              f"{result['end_turn']['turns_per_sec']:.0f} ходов/с, "
+              f"кадр {result['draw_ms']['draw_game_screen']:.2f} мс")
+
+    startup = measure_startup(sizes[-1])
+    print(f"Запуск до первого кадра: без кэша {startup['no_cache_ms']:.0f} мс, "
+          f"с кэшем {startup['warm_cache_ms']:.0f} мс")
+
+    state_cases = []
+    for count in STATE_BUILDING_COUNTS[:2] if args.quick else STATE_BUILDING_COUNTS:
+        result = run_state_case(count, args.turns, args.seed)
+        state_cases.append(result)
+        print(f"Состояние без отрисовки, зданий {result['buildings']}: "
+              f"{result['turns_per_sec']:.0f} ходов/с, "
+              f"{result['bytes_per_building']:.0f} байт на здание, "
+              f"загрузка {result['load_ms']:.0f} мс")
+
+    report = {
+        "created": time.strftime("%Y-%m-%dT%H:%M:%S"),
+        "python": platform.python_version(),
+        "pygame": pygame.version.ver,
+        "platform": platform.platform(),
+        "seed": args.seed,
+        "startup": startup,
+        "cases": cases,
+        "state_cases": state_cases,
+    }
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump(report, f, ensure_ascii=False, indent=2)
+    print(f"Результаты сохранены в {args.output}")
+    pygame.quit()
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,92 @@
+"""Экономика хода: содержание и производство зданий по типам"""
+
+
+class EconomyEngine:
+    """Расчет хода по количеству зданий каждого типа, а не по каждому зданию.
+
+    Ресурсы, содержание и производство - векторы по индексу ресурсов,
+    типы зданий - целые числа, поэтому ход стоит O(типов зданий),
+    а не O(зданий).
+    """
+
+    def __init__(self, num_resources, upkeep, production):
+        self.num_resources = num_resources
+        self.upkeep = dict(upkeep)
+        self.production = dict(production)
+        # Только ненулевые позиции - по ним идут проверки
+        self.upkeep_items = {
+            kind: [(i, v) for i, v in enumerate(vec) if v] for kind, vec in self.upkeep.items()
+        }
+        self.counts = {}
+
+    def add_building(self, kind):
+        self.counts[kind] = self.counts.get(kind, 0) + 1
+
+    def remove_building(self, kind):
+        count = self.counts.get(kind, 0) - 1
+        if count > 0:
+            self.counts[kind] = count
+        else:
+            self.counts.pop(kind, None)
+
+    def rebuild(self, kinds):
+        """Пересчет количества зданий по списку их типов"""
+        self.counts = {}
+        for kind in kinds:
+            self.add_building(kind)
+
+    def resolve_turn(self, stock, ordered_kinds):
+        """Применяет содержание и производство к вектору запасов stock.
+
+        ordered_kinds - типы зданий в порядке постройки; он нужен только
+        при нехватке ресурсов, чтобы пропускать содержание в том же
+        порядке, что и при обходе зданий по одному.
+        Возвращает {тип: (оплачено, не хватило)} для зданий с содержанием.
+        """
+        total_upkeep = [0] * self.num_resources
+        for kind, count in self.counts.items():
+            vector = self.upkeep.get(kind)
+            if vector:
+                for i, amount in enumerate(vector):
+                    total_upkeep[i] += amount * count
+
+        if all(need <= have for need, have in zip(total_upkeep, stock) if need):
+            paid = {kind: c for kind, c in self.counts.items() if kind in self.upkeep}
+            for i, amount in enumerate(total_upkeep):
+                stock[i] -= amount
+        else:
+            paid = self.resolve_upkeep_in_order(stock, ordered_kinds)
+
+        for kind, count in self.counts.items():
+            vector = self.production.get(kind)
+            if vector:
+                for i, amount in enumerate(vector):
+                    stock[i] += amount * count
+
+        return {
+            kind: (paid.get(kind, 0), count - paid.get(kind, 0))
+            for kind, count in self.counts.items() if kind in self.upkeep
+        }
+
+    def resolve_upkeep_in_order(self, stock, ordered_kinds):
+        """Содержание при нехватке ресурсов - в порядке постройки зданий.
+
+        Запасы во время оплаты только убывают, поэтому тип, которому
+        один раз не хватило ресурсов, дальше пропускается без проверки.
+        """
+        paid = {}
+        failed = set()
+        pending = sum(1 for kind in self.counts if kind in self.upkeep)
+        for kind in ordered_kinds:
+            items = self.upkeep_items.get(kind)
+            if items is None or kind in failed:
+                continue
+            if all(stock[i] >= amount for i, amount in items):
+                for i, amount in items:
+                    stock[i] -= amount
+                paid[kind] = paid.get(kind, 0) + 1
+            else:
+                failed.add(kind)
+                if len(failed) == pending:
+                    break
+        return paid
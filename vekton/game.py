@@ -4,6 +4,25 @@ import sys
 import os
 import subprocess
 import importlib.util
+import math
+import hashlib
+import time
+import logging
+import multiprocessing
+from collections import OrderedDict, namedtuple
+from concurrent.futures import ThreadPoolExecutor
+
+from state import (
+    GameState, RULES, CHUNK_SIZE, WORLD_SIZE, PLAYER, BUILDING_IDS, BUILDING_NAMES, TERRAIN_IDS, UNIT_IDS,
+    BUILDING_COSTS, BUILDING_UPKEEP, BUILDING_PRODUCTION, UNIT_COSTS
+)
+from savegame import Autosaver, get_save_dir, load_game, save_game
+from profiler import Profiler
+from replay import ReplayLog, apply_command, new_log_path, BUILD, RECRUIT, END_TURN, RESOLUTION, MOVE
+from ai import AIController
+from gamelog import get_logger, setup_logging
+
+log = get_logger("game")
 
 # Цвета
 GREEN = (34, 139, 34)
@@ -16,6 +35,12 @@ LIGHT_BLUE = (100, 100, 200)
 ORANGE = (255, 165, 0)
 YELLOW = (255, 255, 0)
 
+# Рамки зданий и юнитов противников, по номеру фракции
+FACTION_COLORS = [None, RED, ORANGE, YELLOW, GREEN]
+
+# Компьютерных противников в новой партии
+AI_FACTIONS = 2
+
 # Игровые состояния
 MAIN_MENU = 0
 GAME_SCREEN = 1
@@ -23,6 +48,20 @@ MOL_MENU = 2
 BUILD_MENU = 3
 SETTINGS_MENU = 4
 
+# Смещение юнита внутри клетки при отрисовке
+UNIT_OFFSET = (10, 0)
+
+# Сдвиг мыши (пикселей), до которого нажатие считается щелчком, а не перетаскиванием
+CLICK_SLOP = 5
+
+# Сколько экранов отрисованных кусков карты держать в кэше: объем
+# считается в пикселях от числа кусков, видимых при текущем масштабе
+CHUNK_CACHE_SCREENS = 4
+
+# Масштабы карты и скорость прокрутки клавишами (пикселей за кадр)
+ZOOM_LEVELS = [0.5, 0.75, 1.0, 1.5, 2.0]
+SCROLL_SPEED = 20
+
 # Доступные разрешения экрана
 RESOLUTIONS = [
     (1900, 1000),
@@ -33,6 +72,66 @@ RESOLUTIONS = [
     (0, 0)  # Автоматическое определение
 ]
 
+# Картинки клеток, зданий и юнитов на карте - из файла описаний
+TERRAIN_FILES = {terrain["name"]: terrain["image"] for terrain in RULES["terrain"]}
+BUILDING_FILES = {building["name"]: building["image"] for building in RULES["buildings"]}
+UNIT_FILES = {unit["name"]: unit["image"] for unit in RULES["units"]}
+MAP_FILES = set(TERRAIN_FILES.values()) | set(BUILDING_FILES.values()) | set(UNIT_FILES.values())
+
+# Иконки ресурсов на панели справа
+PANEL_RESOURCES = [(item["image"], item["resource"]) for item in RULES["resource_panel"]]
+
+# Порядок зданий в меню построек и подписи о размещении
+BUILD_MENU_ORDER = RULES["build_menu"]
+MENU_COLUMNS = 4
+MENU_BUTTON_SIZE = 80
+MENU_BUTTON_MARGIN = 20
+BUILDING_PLACEMENT = {building["name"]: building.get("placement") for building in RULES["buildings"]}
+
+# Иконки размером с клетку, упаковываются в один атлас
+ICON_FILES = list(dict.fromkeys(
+    ["corner.jpg", "corner1.jpg", "mol.jpg"]
+    + list(TERRAIN_FILES.values()) + list(BUILDING_FILES.values()) + list(UNIT_FILES.values())
+))
+
+# Максимальное количество закэшированных текстовых поверхностей
+TEXT_CACHE_SIZE = 512
+
+# Кнопка интерфейса: область, имя метода Game и его аргументы, подсказка при наведении
+Widget = namedtuple("Widget", "rect action args hover")
+# Размер ячейки сетки для поиска кнопки под курсором, пикселей
+WIDGET_GRID_CELL = 64
+
+# События, которые обрабатывает игра; остальные не попадают в очередь
+HANDLED_EVENTS = [
+    pygame.QUIT, pygame.KEYDOWN, pygame.MOUSEBUTTONDOWN, pygame.MOUSEBUTTONUP,
+    pygame.MOUSEMOTION, pygame.MOUSEWHEEL, pygame.VIDEOEXPOSE,
+    pygame.WINDOWFOCUSLOST, pygame.WINDOWFOCUSGAINED, pygame.WINDOWMINIMIZED,
+    pygame.WINDOWRESTORED, pygame.WINDOWHIDDEN, pygame.WINDOWSHOWN
+]
+
+# Методы, время которых показывает профайлер (F3), и частота обновления его текста, с
+PROFILED_METHODS = [
+    "handle_events", "update_loading", "update_camera", "end_turn",
+    "draw_main_menu", "draw_game_screen", "draw_terrain", "draw_resource_panel",
+    "draw_mol_menu", "draw_settings_menu", "draw_loading_bar", "flip"
+]
+PROFILE_OVERLAY_INTERVAL = 0.25
+
+# Ограничение FPS по умолчанию (0 - без ограничения) и сколько ждать событий, мс:
+# когда на экране ничего не движется и когда окно свернуто или не в фокусе
+FPS_CAP = 60
+IDLE_WAIT_MS = 1000
+PAUSED_WAIT_MS = 2000
+
+# Клавиши прокрутки карты: (вправо, влево, вниз, вверх)
+CAMERA_KEYS = [
+    (pygame.K_RIGHT, pygame.K_d),
+    (pygame.K_LEFT, pygame.K_a),
+    (pygame.K_DOWN, pygame.K_s),
+    (pygame.K_UP, pygame.K_w)
+]
+
 def verify_environment():
     """Проверка безопасности окружения"""
     try:
@@ -51,81 +150,418 @@ def verify_environment():
     except Exception:
         return False
 
-def load_image(filename, size=None):
-    """Безопасная загрузка изображения или создание заглушки"""
-    try:
-        # Сначала пробуем загрузить из текущей директории
-        if os.path.exists(filename):
-            image = pygame.image.load(filename)
-        else:
-            # Пробуем загрузить из папки images
-            image_path = os.path.join("images", filename)
-            if os.path.exists(image_path):
-                image = pygame.image.load(image_path)
-            else:
-                # Создаем цветную заглушку
-                placeholder = pygame.Surface(size if size else (50, 50))
-                colors = {
-                    "bg_image.png": (50, 100, 150),
-                    "Play.png": (200, 0, 0),
-                    "mol.jpg": (0, 0, 255),
-                    "corner.jpg": (255, 0, 0),
-                    "corner1.jpg": (0, 255, 0),
-                    "gelezo.jpg": (100, 100, 100),
-                    "medi.jpg": (255, 165, 0),
-                    "forest.jpg": (0, 100, 0),
-                    "nefti.jpg": (0, 0, 0),
-                    "pole.jpg": (210, 180, 140),
-                    "polena.jpg": (139, 69, 19),
-                    "zavod.jpg": (128, 128, 128), 
-                    "ibrari.jpg": (75, 0, 130),
-                    "fika.jpg": (255, 192, 203),
-                    "losplka.jpg": (160, 82, 45),
-                    "voenka.jpg": (139, 0, 0),
-                    "soldat.jpg": (220, 20, 60),
-                    "people.jpg": (200, 200, 100),
-                    "stone.png": (150, 150, 150),
-                    "components.jpg": (150, 0, 100),
-                    "rydnik glezo.jpg": (80, 80, 120),
-                    "rydnik kamini.jpg": (120, 120, 120),
-                    "rydnik midi.jpg": (200, 120, 50),
-                    "settings.png": (100, 100, 200),
-                    "настройки.png": (100, 100, 200)
-                }
-
-                if filename in colors:
-                    placeholder.fill(colors[filename])
-                else:
-                    placeholder.fill((random.randint(50, 200), random.randint(50, 200), random.randint(50, 200)))
+def find_image(filename):
+    """Путь к изображению: текущая папка или папка images; None, если файла нет"""
+    if os.path.exists(filename):
+        return filename
+    image_path = os.path.join("images", filename)
+    if os.path.exists(image_path):
+        return image_path
+    return None
+
+def make_placeholder(filename, size=None):
+    """Цветная заглушка вместо отсутствующего изображения"""
+    placeholder = pygame.Surface(size if size else (50, 50))
+    colors = {
+        "bg_image.png": (50, 100, 150),
+        "Play.png": (200, 0, 0),
+        "mol.jpg": (0, 0, 255),
+        "corner.jpg": (255, 0, 0),
+        "corner1.jpg": (0, 255, 0),
+        "gelezo.jpg": (100, 100, 100),
+        "medi.jpg": (255, 165, 0),
+        "forest.jpg": (0, 100, 0),
+        "nefti.jpg": (0, 0, 0),
+        "pole.jpg": (210, 180, 140),
+        "polena.jpg": (139, 69, 19),
+        "zavod.jpg": (128, 128, 128), 
+        "ibrari.jpg": (75, 0, 130),
+        "fika.jpg": (255, 192, 203),
+        "losplka.jpg": (160, 82, 45),
+        "voenka.jpg": (139, 0, 0),
+        "soldat.jpg": (220, 20, 60),
+        "people.jpg": (200, 200, 100),
+        "stone.png": (150, 150, 150),
+        "components.jpg": (150, 0, 100),
+        "rydnik glezo.jpg": (80, 80, 120),
+        "rydnik kamini.jpg": (120, 120, 120),
+        "rydnik midi.jpg": (200, 120, 50),
+        "settings.png": (100, 100, 200),
+        "настройки.png": (100, 100, 200)
+    }
+
+    if filename in colors:
+        placeholder.fill(colors[filename])
+    else:
+        placeholder.fill((random.randint(50, 200), random.randint(50, 200), random.randint(50, 200)))
 
-                return placeholder
+    return placeholder
 
-        if size:
-            image = pygame.transform.scale(image, size)
-        return image.convert_alpha()
+def get_cache_dir():
+    """Папка для кэша картинок (вне временной папки собранного EXE)"""
+    if os.environ.get("VEKTOR_CACHE_DIR"):
+        return os.environ["VEKTOR_CACHE_DIR"]
+    if os.name == "nt" and os.environ.get("LOCALAPPDATA"):
+        base = os.environ["LOCALAPPDATA"]
+    else:
+        base = os.environ.get("XDG_CACHE_HOME") or os.path.join(os.path.expanduser("~"), ".cache")
+    return os.path.join(base, "vektor", "images")
+
+class ImageDiskCache:
+    """Кэш на диске: уже масштабированные картинки в виде сырых RGBA-пикселей.
+
+    Ключ - (хэш исходного файла, размер, формат пикселей), поэтому при
+    изменении картинки запись просто не находится и создается заново.
+    Ошибки диска не мешают игре - кэш тогда молча не используется.
+    """
+
+    PIXEL_FORMAT = "RGBA"
+
+    def __init__(self, directory=None):
+        self.directory = directory or get_cache_dir()
+        self.hashes = {}
+        self.hits = 0
+        self.misses = 0
+
+    def file_hash(self, image_path):
+        digest = self.hashes.get(image_path)
+        if digest is None:
+            with open(image_path, "rb") as f:
+                digest = hashlib.blake2b(f.read(), digest_size=16).hexdigest()
+            self.hashes[image_path] = digest
+        return digest
+
+    def entry_prefix(self, image_path):
+        """Начало имени файла кэша - одинаковое для всех версий одной картинки"""
+        name = os.path.basename(image_path).replace(" ", "_").replace(".", "_")
+        return f"{name}-"
+
+    def entry_path(self, image_path, size):
+        return os.path.join(
+            self.directory,
+            f"{self.entry_prefix(image_path)}{self.file_hash(image_path)}-{size[0]}x{size[1]}-{self.PIXEL_FORMAT}.raw"
+        )
 
-    except pygame.error as e:
-        print(f"Ошибка загрузки изображения {filename}: {e}")
-        placeholder = pygame.Surface(size if size else (50, 50))
-        placeholder.fill((200, 100, 100))
-        return placeholder
+    def read(self, image_path, size):
+        """Сырые пиксели из кэша или None (можно вызывать из фонового потока)"""
+        try:
+            path = self.entry_path(image_path, size)
+            with open(path, "rb") as f:
+                data = f.read()
+        except OSError:
+            self.misses += 1
+            return None
+
+        if len(data) != size[0] * size[1] * 4:
+            self.misses += 1
+            return None
+        self.hits += 1
+        return data
+
+    def to_surface(self, data, size):
+        """Поверхность из сырых пикселей (только в главном потоке)"""
+        return pygame.image.frombuffer(data, size, self.PIXEL_FORMAT).convert_alpha()
+
+    def load(self, image_path, size):
+        """Картинка из кэша или None"""
+        data = self.read(image_path, size)
+        if data is None:
+            return None
+        return self.to_surface(data, size)
+
+    def store(self, image_path, size, surface):
+        """Сохранение картинки; старые версии этого файла удаляются"""
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            path = self.entry_path(image_path, size)
+            prefix = self.entry_prefix(image_path)
+            digest = self.file_hash(image_path)
+            for entry in os.listdir(self.directory):
+                if entry.startswith(prefix) and digest not in entry:
+                    os.remove(os.path.join(self.directory, entry))
+
+            tmp_path = f"{path}.{os.getpid()}.tmp"
+            with open(tmp_path, "wb") as f:
+                f.write(pygame.image.tostring(surface, self.PIXEL_FORMAT))
+            os.replace(tmp_path, path)
+        except OSError:
+            pass
+
+class AssetManager:
+    """Изображения игры: оригиналы декодируются один раз, масштабированные копии кэшируются"""
+
+    def __init__(self, disk_cache=None):
+        self.originals = {}
+        self.scaled = {}
+        self.disk_cache = disk_cache
+
+        # Фоновая загрузка: картинки из кэша на диске и задания потоков
+        self.preloaded = {}
+        self.pending = {}
+        self.loading_total = 0
+        self.executor = None
+        # Ячейки атласов с заглушками: файл -> [(размер, подповерхность)]
+        self.atlas_slots = {}
+
+    def original(self, filename):
+        """Декодированный оригинал (None, если файла нет или он поврежден)"""
+        if filename not in self.originals:
+            image = None
+            image_path = find_image(filename)
+            if image_path:
+                try:
+                    image = pygame.image.load(image_path).convert_alpha()
+                except pygame.error as e:
+                    log.warning("Ошибка загрузки изображения %s: %s", filename, e)
+            self.originals[filename] = image
+        return self.originals[filename]
+
+    def scale_original(self, filename, size):
+        """Масштабированная копия: с диска, если есть в кэше, иначе из оригинала"""
+        image = self.preloaded.get((filename, tuple(size)))
+        if image is not None:
+            return image
+
+        image_path = find_image(filename) if self.disk_cache else None
+        if image_path:
+            image = self.disk_cache.load(image_path, size)
+            if image is not None:
+                return image
+
+        original = self.original(filename)
+        if original is None:
+            return make_placeholder(filename, size)
+        image = pygame.transform.scale(original, size)
+        if image_path:
+            self.disk_cache.store(image_path, size, image)
+        return image
+
+    def get(self, filename, size):
+        """Изображение нужного размера из кэша по ключу (файл, размер)"""
+        key = (filename, tuple(size))
+        image = self.scaled.get(key)
+        if image is None:
+            if filename in self.pending:
+                # Еще грузится - временная заглушка, в кэш не попадает
+                return make_placeholder(filename, size)
+            image = self.scale_original(filename, size)
+            self.scaled[key] = image
+        return image
+
+    def build_atlas(self, filenames, size):
+        """Упаковка иконок одного размера в одну поверхность.
+
+        Возвращает {файл: подповерхность атласа}; они же попадают в кэш
+        масштабированных изображений.
+        """
+        width, height = size
+        columns = max(1, math.ceil(math.sqrt(len(filenames))))
+        rows = max(1, math.ceil(len(filenames) / columns))
+        atlas = pygame.Surface((columns * width, rows * height), pygame.SRCALPHA).convert_alpha()
+
+        icons = {}
+        for i, filename in enumerate(filenames):
+            rect = pygame.Rect((i % columns) * width, (i // columns) * height, width, height)
+            if filename in self.pending:
+                # Картинка подставится в ячейку, когда догрузится
+                atlas.blit(make_placeholder(filename, size), rect)
+                icons[filename] = atlas.subsurface(rect)
+                self.atlas_slots.setdefault(filename, []).append((tuple(size), icons[filename]))
+                continue
+            atlas.blit(self.scale_original(filename, size), rect)
+            icons[filename] = atlas.subsurface(rect)
+            self.scaled[(filename, tuple(size))] = icons[filename]
+        return icons
+
+    def start_loading(self, requests, workers=4):
+        """Запуск фонового чтения и декодирования картинок.
+
+        requests - список (файл, размер). Пока файл грузится, вместо него
+        выдаются заглушки; готовые картинки забирает poll_loading().
+        """
+        sizes = {}
+        for filename, size in requests:
+            sizes.setdefault(filename, set()).add(tuple(size))
+
+        self.executor = ThreadPoolExecutor(max_workers=workers)
+        for filename, file_sizes in sizes.items():
+            if filename in self.originals:
+                continue
+            self.pending[filename] = self.executor.submit(self.read_asset, filename, file_sizes)
+        self.loading_total = len(self.pending)
+
+    def read_asset(self, filename, sizes):
+        """Работа фонового потока: пиксели из кэша на диске или декодированный оригинал"""
+        image_path = find_image(filename)
+        if image_path is None:
+            return None, {}
+
+        pixels = {}
+        if self.disk_cache:
+            for size in sizes:
+                data = self.disk_cache.read(image_path, size)
+                if data is not None:
+                    pixels[size] = data
+
+        image = None
+        if len(pixels) < len(sizes):
+            image = pygame.image.load(image_path)
+        return image, pixels
+
+    def poll_loading(self):
+        """Забирает готовые картинки (конвертация - в главном потоке, как требует SDL).
+
+        Заглушки в атласах сразу заменяются картинками; возвращает
+        список догруженных файлов - остальные копии обновляет вызывающий.
+        """
+        finished = []
+        for filename, future in list(self.pending.items()):
+            if not future.done():
+                continue
+            del self.pending[filename]
+            finished.append(filename)
+            try:
+                image, pixels = future.result()
+            except (pygame.error, OSError) as e:
+                log.warning("Ошибка загрузки изображения %s: %s", filename, e)
+                image, pixels = None, {}
+
+            for size, data in pixels.items():
+                self.preloaded[(filename, size)] = self.disk_cache.to_surface(data, size)
+            if image is not None:
+                self.originals[filename] = image.convert_alpha()
+            elif not pixels:
+                self.originals[filename] = None
+
+            for size, icon in self.atlas_slots.pop(filename, ()):
+                icon.fill((0, 0, 0, 0))
+                icon.blit(self.scale_original(filename, size), (0, 0))
+                self.scaled[(filename, size)] = icon
+
+        if not self.pending and self.executor:
+            self.executor.shutdown(wait=False)
+            self.executor = None
+        return finished
+
+    def loading_progress(self):
+        """Доля загруженного от 0 до 1"""
+        if not self.loading_total:
+            return 1.0
+        return 1.0 - len(self.pending) / self.loading_total
+
+    def is_loading(self):
+        return bool(self.pending)
+
+    def clear_scaled(self):
+        """Сброс масштабированных копий, оригиналы остаются в памяти"""
+        self.scaled.clear()
+        self.preloaded.clear()
+        self.atlas_slots.clear()
+
+class TextCache:
+    """Общий реестр шрифтов и LRU-кэш отрисованного текста"""
+
+    def __init__(self, max_size=TEXT_CACHE_SIZE):
+        self.max_size = max_size
+        self.fonts = {}
+        self.surfaces = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get_font(self, size):
+        """Шрифт заданного размера, создается один раз"""
+        font = self.fonts.get(size)
+        if font is None:
+            font = pygame.font.Font(None, size)
+            self.fonts[size] = font
+        return font
+
+    def render(self, text, size, color):
+        """Отрисованный текст из кэша по ключу (текст, размер, цвет)"""
+        key = (text, size, tuple(color))
+        surface = self.surfaces.get(key)
+        if surface is not None:
+            self.surfaces.move_to_end(key)
+            self.hits += 1
+            return surface
+
+        self.misses += 1
+        surface = self.get_font(size).render(text, True, color)
+        self.surfaces[key] = surface
+        if len(self.surfaces) > self.max_size:
+            self.surfaces.popitem(last=False)
+        return surface
+
+    def clear(self):
+        """Сброс кэша (например, при смене размеров шрифтов)"""
+        self.fonts.clear()
+        self.surfaces.clear()
+
+    def stats(self):
+        """Счетчики попаданий и промахов кэша"""
+        return {"hits": self.hits, "misses": self.misses, "size": len(self.surfaces)}
+
+class WidgetGrid:
+    """Кнопки экрана, разложенные по ячейкам сетки.
+
+    Кнопка под курсором ищется только среди кнопок его ячейки; при
+    наложении побеждает добавленная раньше.
+    """
+
+    def __init__(self, cell_size=WIDGET_GRID_CELL):
+        self.cell_size = cell_size
+        self.cells = {}
+
+    def add(self, rect, action, args=(), hover=None):
+        """action - имя метода Game, вызываемого с args; hover - что показать при наведении"""
+        widget = Widget(pygame.Rect(rect), action, args, hover)
+        size = self.cell_size
+        for cell_x in range(widget.rect.left // size, (widget.rect.right - 1) // size + 1):
+            for cell_y in range(widget.rect.top // size, (widget.rect.bottom - 1) // size + 1):
+                self.cells.setdefault((cell_x, cell_y), []).append(widget)
+
+    def at(self, pos):
+        for widget in self.cells.get((pos[0] // self.cell_size, pos[1] // self.cell_size), ()):
+            if widget.rect.collidepoint(pos):
+                return widget
+        return None
 
 class Game:
-    def __init__(self):
+    def __init__(self, dirty_rendering=False, headless=False, size=None, image_cache=True,
+                 background_loading=True, world_size=None, seed=None, autosave=True,
+                 replay=True, profile=False, fps_cap=FPS_CAP, vsync=False, ai_factions=AI_FACTIONS):
+        # Без окна: для симуляции и замеров производительности
+        self.headless = headless
+        if headless:
+            os.environ.setdefault("SDL_VIDEODRIVER", "dummy")
         pygame.init()
         
         # Автоматическое определение разрешения экрана
         self.current_resolution = 5
         self.screen_info = pygame.display.Info()
-        self.screen_width = self.screen_info.current_w
-        self.screen_height = self.screen_info.current_h
+        if size:
+            self.screen_width, self.screen_height = size
+        else:
+            self.screen_width = self.screen_info.current_w
+            self.screen_height = self.screen_info.current_h
         
-        # Устанавливаем окно на весь экран
-        self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.FULLSCREEN)
+        # Темп кадров: ограничение FPS, вертикальная синхронизация, пауза без фокуса
+        self.fps_cap = fps_cap
+        self.vsync = vsync
+        self.window_focused = True
+
+        # Без размера - окно на весь экран
+        self.set_display_mode(fullscreen=not (headless or size))
         pygame.display.set_caption("vektor  ")
 
+        # В очередь попадают только обрабатываемые события (не TEXTINPUT, KEYUP и т.п.)
+        pygame.event.set_blocked(None)
+        pygame.event.set_allowed(HANDLED_EVENTS)
+
         self.state = MAIN_MENU
         self.clock = pygame.time.Clock()
+        self.text_cache = TextCache()
+        self.assets = AssetManager(ImageDiskCache() if image_cache else None)
         
         # Расчет размеров элементов на основе разрешения экрана
         self.cell_size = max(30, min(50, self.screen_width // 40))
@@ -137,72 +573,95 @@ class Game:
         # Обновляем размеры элементов интерфейса
         self.update_ui_elements()
 
-        self.resources = []
-        self.buildings = []
-        self.military_units = []
-        self.turn_count = 1
-
-        # Ресурсы игрока
-        self.player_resources = {
-            "Дерево": 200,
-            "Железо": 200,
-            "Медь": 200,
-            "Нефть": 0,
-            "Люди": 0,
-            "Камень": 200,
-            "компоненты": 150
-        }
-
-        # Стоимость построек
-        self.building_costs = {
-            "Лесопилка": {"Дерево": 10, "Камень": 5, "компоненты": 3},
-            "Завод": {"Железо": 5, "Медь": 5, "компоненты": 5},
-            "Лаборатория": {"Дерево": 100, "Камень": 100, "компоненты": 50, "Медь": 100},
-            "Военный завод": {"Железо": 6, "Дерево": 7, "компоненты": 2},
-            "Нефтяная вышка": {"Железо": 8, "Дерево": 10, "компоненты": 5},
-            "Железная шахта": {"Дерево": 15, "Камень": 10, "компоненты": 8},
-            "Каменная шахта": {"Дерево": 12, "Железо": 5, "компоненты": 6},
-            "Медная шахта": {"Дерево": 10, "Камень": 8, "компоненты": 5}
-        }
-
-        # Потребление ресурсов зданиями каждый ход
-        self.building_upkeep = {
-            "Завод": {"Железо": 1, "Медь": 1},
-            "Лаборатория": {"компоненты": 2},
-            "Военный завод": {"Железо": 1}
-        }
-
-        # Производство ресурсов зданиями каждый ход
-        self.building_production = {
-            "Завод": {"компоненты": 2},
-            "Лесопилка": {"Дерево": 1},
-            "Нефтяная вышка": {"Нефть": 1},
-            "Лаборатория": {"компоненты": 3},
-            "Железная шахта": {"Железо": 1},
-            "Каменная шахта": {"Камень": 1},
-            "Медная шахта": {"Медь": 1}
-        }
-
-        # Стоимость юнитов
-        self.unit_costs = {
-            "Солдат": {"Люди": 5}
-        }
-
-        # Загрузка изображений
+        # Данные партии хранятся отдельно от отрисовки; карта больше экрана
+        # и прокручивается камерой
+        self.world = GameState(*(world_size or WORLD_SIZE), seed=seed)
+        for i in range(ai_factions):
+            self.world.add_faction(f"Противник {i + 1}")
+        # Ходы противников считаются в других процессах, пока игрок ходит
+        self.ai = None
+        self.end_turn_queued = False
+        self.start_ai()
+
+        # Сохранения: быстрое по F5/F9 и автосохранение в конце каждого хода
+        self.save_dir = get_save_dir()
+        self.quicksave_path = os.path.join(self.save_dir, "quicksave.vks")
+        self.autosaver = Autosaver(os.path.join(self.save_dir, "autosave.vks")) if autosave else None
+
+        # Журнал команд партии - для повтора по отчетам об ошибках
+        self.replay_log = None
+        if replay:
+            self.start_replay_log()
+
+        # Камера: смещение видимой части карты в пикселях и масштаб
+        self.camera_x = 0
+        self.camera_y = 0
+        self.zoom_index = ZOOM_LEVELS.index(1.0)
+        self.update_tile_size()
+        self.terrain_chunks = OrderedDict()
+        self.terrain_chunk_pixels = 0
+
+        # Таблицы правил (по названиям - для подписей в интерфейсе)
+        self.building_costs = BUILDING_COSTS
+        self.building_upkeep = BUILDING_UPKEEP
+        self.building_production = BUILDING_PRODUCTION
+        self.unit_costs = UNIT_COSTS
+
+        # Загрузка изображений: в фоне (меню сразу открыто, вместо картинок
+        # сначала заглушки) или сразу (без окна)
+        self.loading_progress = 1.0
+        if background_loading and not headless:
+            self.assets.start_loading(self.image_requests())
+            self.loading_progress = 0.0
         self.load_images()
 
-        # Размещаем углы
-        self.corner_pos = (self.screen_width - 100, self.screen_height - 100)
-        self.corner1_pos = (50, 50)
-
-        # Генерируем ресурсы на карте
-        self.generate_resources()
+        # Ресурсы на карте создаются по зерну seed, кусками по мере показа
+        self.invalidate_terrain()
 
         # Выбранное здание для строительства
         self.selected_building = None
 
-        # Для анимации наведения в меню построек
+        # Выделенные юниты (номера в списке юнитов), начало рамки выделения
+        # и сдвиг мыши с нажатия правой кнопки (щелчок - приказ идти)
+        self.selected_units = []
+        self.selection_start = None
+        self.order_drag = None
+
+        # Для анимации наведения в меню построек; наведение пересчитывается
+        # при движении мыши и при открытии меню (hover_state - состояние прошлого кадра)
         self.hovered_building = None
+        self.hover_state = None
+
+        # Обработчики событий по состояниям
+        self.register_handlers()
+
+        # Режим отрисовки только измененных областей экрана
+        self.dirty_rendering = dirty_rendering
+        self.dirty_rects = []
+        self.full_redraw = True
+        self.drawn_state = None
+        self.last_preview_rect = None
+
+        # Профайлер кадра: F3 - оверлей с замерами, F4 - выгрузка в CSV
+        self.profiler = Profiler()
+        self.profile_overlay = None
+        self.profile_overlay_time = 0
+        if profile:
+            self.toggle_profiler()
+
+    def set_display_mode(self, fullscreen):
+        """Создание окна текущего размера; vsync - если драйвер его поддерживает"""
+        size = (self.screen_width, self.screen_height)
+        flags = pygame.FULLSCREEN if fullscreen else 0
+        if self.vsync:
+            try:
+                # В pygame вертикальная синхронизация работает только с SCALED или OPENGL
+                self.screen = pygame.display.set_mode(size, flags | pygame.SCALED, vsync=1)
+                return
+            except pygame.error as e:
+                log.info("Вертикальная синхронизация недоступна: %s", e)
+                self.vsync = False
+        self.screen = pygame.display.set_mode(size, flags)
 
     def update_ui_elements(self):
         """Обновление размеров и позиций элементов интерфейса"""
@@ -225,159 +684,359 @@ class Game:
             self.screen_height - button_height - 20,
             button_width, button_height
         )
+        self.play_button_rect = pygame.Rect((0, 0), self.image_sizes()[1])
+        self.play_button_rect.center = (self.screen_width // 2, self.screen_height // 2)
         self.settings_button_rect = pygame.Rect(
             self.screen_width // 2 - button_width // 2,
             self.screen_height // 2 + 120,
             button_width, button_height
         )
 
-    def load_images(self):
-        """Загрузка всех изображений с адаптивными размерами"""
+        panel_width = max(200, self.screen_width // 8)
+        panel_height = max(300, self.screen_height // 2)
+        self.resource_panel_rect = pygame.Rect(self.screen_width - panel_width - 20, 60, panel_width, panel_height)
+        # Углы
+        self.corner_pos = (self.screen_width - 100, self.screen_height - 100)
+        self.corner1_pos = (50, 50)
+
+        # Область под надпись с номером хода
+        self.turn_label_rect = pygame.Rect(20, 20, self.screen_width // 4, self.font_size_large)
+
+        # Кнопки меню построек и настроек - один раз на разрешение,
+        # общие для обработки событий и отрисовки
+        self.close_button_rect = pygame.Rect(self.mol_menu_rect.right - 30, self.mol_menu_rect.y + 10, 20, 20)
+        self.menu_buttons = self.build_menu_buttons()
+        self.resolution_buttons = [
+            pygame.Rect(self.mol_menu_rect.x + 50, self.mol_menu_rect.y + 60 + i * 60, self.mol_menu_rect.width - 100, 50)
+            for i in range(len(RESOLUTIONS))
+        ]
+        self.widgets = self.build_widgets()
+
+        # Полоса загрузки картинок внизу экрана
+        self.loading_bar_rect = pygame.Rect(self.screen_width // 4, self.screen_height - 30, self.screen_width // 2, 10)
+
+        # Затемнение под меню - одна поверхность на разрешение.
+        # Черная поверхность с общей прозрачностью рисуется быстрее, чем SRCALPHA.
+        self.dim_overlay = pygame.Surface((self.screen_width, self.screen_height))
+        self.dim_overlay.fill(BLACK)
+        self.dim_overlay.set_alpha(128)
+
+        # Снимок экрана под открытым меню (создается при первой отрисовке меню)
+        self.menu_background = None
+        self.menu_background_key = None
+
+    def image_sizes(self):
+        """Размеры фона, кнопок, иконок клеток и иконок панели для текущего разрешения"""
         bg_size = (self.screen_width, self.screen_height)
         button_size = (max(150, self.screen_width // 8), max(60, self.screen_height // 15))
         icon_size = (self.cell_size, self.cell_size)
+        panel_icon_size = max(30, self.cell_size - 10)
+        return bg_size, button_size, icon_size, panel_icon_size
+
+    def image_requests(self):
+        """Все картинки, которые нужны load_images, вместе с размерами"""
+        bg_size, button_size, icon_size, panel_icon_size = self.image_sizes()
+        requests = [("bg_image.png", bg_size), ("Play.png", button_size), ("settings.png", button_size)]
+        requests += [(filename, icon_size) for filename in ICON_FILES]
+        requests += [(filename, (panel_icon_size, panel_icon_size)) for filename, _ in PANEL_RESOURCES]
+        return requests
+
+    def load_images(self):
+        """Загрузка всех изображений с адаптивными размерами"""
+        bg_size, button_size, icon_size, self.panel_icon_size = self.image_sizes()
         
-        self.bg_image = load_image("bg_image.png", bg_size)
-        self.play_button = load_image("Play.png", button_size)
-        self.corner_image = load_image("corner.jpg", icon_size)
-        self.corner1_image = load_image("corner1.jpg", icon_size)
-        self.mol_image = load_image("mol.jpg", icon_size)
-        self.gelezo_image = load_image("gelezo.jpg", icon_size)
-        self.medi_image = load_image("medi.jpg", icon_size)
-        self.forest_image = load_image("forest.jpg", icon_size)
-        self.nefti_image = load_image("nefti.jpg", icon_size)
-        self.pole_image = load_image("pole.jpg", icon_size)
-        self.polena_image = load_image("polena.jpg", icon_size)
-        self.zavod_image = load_image("zavod.jpg", icon_size)
-        self.ibrari_image = load_image("ibrari.jpg", icon_size)
-        self.fika_image = load_image("fika.jpg", icon_size)
-        self.losplka_image = load_image("losplka.jpg", icon_size)
-        self.voenka_image = load_image("voenka.jpg", icon_size)
-        self.soldat_image = load_image("soldat.jpg", icon_size)
-        self.people_image = load_image("people.jpg", icon_size)
-        self.stone_image = load_image("stone.png", icon_size)
-        self.components_image = load_image("components.jpg", icon_size)
-        self.rydnik_glezo_image = load_image("rydnik glezo.jpg", icon_size)
-        self.rydnik_kamini_image = load_image("rydnik kamini.jpg", icon_size)
-        self.rydnik_midi_image = load_image("rydnik midi.jpg", icon_size)
-        self.settings_image = load_image("settings.png", button_size)
-
-        # Создаем список всех ресурсов для размещения на карте
-        self.resource_types = [
-            self.gelezo_image, self.medi_image, self.forest_image,
-            self.nefti_image, self.pole_image, self.stone_image
+        self.bg_image = self.assets.get("bg_image.png", bg_size)
+        self.play_button = self.assets.get("Play.png", button_size)
+        self.settings_image = self.assets.get("settings.png", button_size)
+
+        icons = self.assets.build_atlas(ICON_FILES, icon_size)
+        self.corner_image = icons["corner.jpg"]
+        self.corner1_image = icons["corner1.jpg"]
+        self.mol_image = icons["mol.jpg"]
+
+        # Иконки панели ресурсов масштабируются один раз, а не каждый кадр
+        panel_icon_size = (self.panel_icon_size, self.panel_icon_size)
+        self.panel_icons = [
+            (self.assets.get(filename, panel_icon_size), resource_name)
+            for filename, resource_name in PANEL_RESOURCES
         ]
 
-        # Соответствие изображений зданий их типам
-        self.building_images = {
-            "Лесопилка": self.losplka_image,
-            "Завод": self.zavod_image,
-            "Лаборатория": self.ibrari_image,
-            "Нефтяная вышка": self.fika_image,
-            "Военный завод": self.voenka_image,
-            "Железная шахта": self.rydnik_glezo_image,
-            "Каменная шахта": self.rydnik_kamini_image,
-            "Медная шахта": self.rydnik_midi_image
-        }
-
-        # Соответствие изображений юнитов их типам
-        self.unit_images = {
-            "Солдат": self.soldat_image
-        }
+        # Изображения клеток, зданий и юнитов по названиям
+        self.terrain_images = {name: icons[filename] for name, filename in TERRAIN_FILES.items()}
+        self.building_images = {name: icons[filename] for name, filename in BUILDING_FILES.items()}
+        self.unit_images = {name: icons[filename] for name, filename in UNIT_FILES.items()}
+
+        self.update_map_sprites()
+
+    def update_map_sprites(self):
+        """Спрайты карты по целочисленным типам под текущий масштаб"""
+        size = (self.tile_size, self.tile_size)
+        self.terrain_sprites = {TERRAIN_IDS[name]: self.assets.get(f, size) for name, f in TERRAIN_FILES.items()}
+        self.building_sprites = {BUILDING_IDS[name]: self.assets.get(f, size) for name, f in BUILDING_FILES.items()}
+        self.unit_sprites = {UNIT_IDS[name]: self.assets.get(f, size) for name, f in UNIT_FILES.items()}
+        # Полупрозрачные копии для призрака здания - по одной на тип
+        self.ghost_sprites = {}
+        # Копии с рамкой цвета фракции: (id словаря спрайтов, тип, фракция) -> спрайт
+        self.faction_sprites = {}
+        # Слои сущностей собраны из старых спрайтов
+        self.entity_layers = ([], [])
+        self.entity_layers_key = None
+
+    def get_ghost_sprite(self, kind):
+        """Полупрозрачный спрайт здания для предпросмотра постройки"""
+        sprite = self.ghost_sprites.get(kind)
+        if sprite is None:
+            sprite = self.building_sprites[kind].copy()
+            sprite.set_alpha(128)
+            self.ghost_sprites[kind] = sprite
+        return sprite
+
+    def get_entity_sprite(self, sprites, entity):
+        """Спрайт здания или юнита; у противников - с рамкой цвета фракции"""
+        if entity.owner == PLAYER:
+            return sprites[entity.kind]
+        key = (id(sprites), entity.kind, entity.owner)
+        sprite = self.faction_sprites.get(key)
+        if sprite is None:
+            sprite = sprites[entity.kind].copy()
+            color = FACTION_COLORS[entity.owner % len(FACTION_COLORS)] or RED
+            pygame.draw.rect(sprite, color, sprite.get_rect(), max(2, self.tile_size // 16))
+            self.faction_sprites[key] = sprite
+        return sprite
 
     def change_resolution(self, resolution_index):
         """Изменение разрешения экрана"""
         if 0 <= resolution_index < len(RESOLUTIONS):
             self.current_resolution = resolution_index
+            old_width, old_height = self.screen_width, self.screen_height
             
             if resolution_index == 5:
                 self.screen_width = self.screen_info.current_w
                 self.screen_height = self.screen_info.current_h
-                self.screen = pygame.display.set_mode((self.screen_width, self.screen_height), pygame.FULLSCREEN)
+                self.set_display_mode(fullscreen=True)
             else:
                 self.screen_width, self.screen_height = RESOLUTIONS[resolution_index]
-                self.screen = pygame.display.set_mode((self.screen_width, self.screen_height))
+                self.set_display_mode(fullscreen=False)
             
+            # Точка карты в центре экрана - на нее камера встанет после смены
+            center_x = (self.camera_x + old_width / 2) / self.tile_size
+            center_y = (self.camera_y + old_height / 2) / self.tile_size
+
             self.cell_size = max(30, min(50, self.screen_width // 40))
             self.font_size_small = max(14, self.screen_width // 100)
             self.font_size_medium = max(18, self.screen_width // 80)
             self.font_size_large = max(24, self.screen_width // 60)
             self.font_size_title = max(36, self.screen_width // 40)
             
+            # Размеры шрифтов и картинок изменились - сбрасываем кэши
+            self.text_cache.clear()
+            self.assets.clear_scaled()
+            
+            # Карта сохраняется, меняется только камера
+            self.update_tile_size()
+            self.center_camera_on(center_x, center_y)
             self.update_ui_elements()
             self.load_images()
-            self.generate_resources()
+            self.invalidate_terrain()
+            self.mark_dirty()
+            self.record_command(RESOLUTION, arg=resolution_index)
             
             return True
         return False
 
-    def generate_resources(self):
-        """Генерация ресурсов на карте с адаптивным количеством"""
-        self.resources = []
-        num_resources = max(50, (self.screen_width * self.screen_height) // 2500)
-        
-        for _ in range(num_resources):
-            x = random.randint(1, (self.screen_width - 200) // self.cell_size - 1) * self.cell_size
-            y = random.randint(1, (self.screen_height - 100) // self.cell_size - 1) * self.cell_size
-            resource_type = random.choice(self.resource_types)
-            self.resources.append({
-                'image': resource_type,
-                'pos': (x, y),
-                'type': self.get_resource_type(resource_type)
-            })
+    def invalidate_terrain(self):
+        """Сброс кэша отрисованных кусков карты"""
+        self.terrain_chunks.clear()
+        self.terrain_chunk_pixels = 0
+
+    def chunk_cache_budget(self):
+        """Сколько пикселей кусков карты держать в кэше при текущем масштабе и экране"""
+        chunk_pixels = CHUNK_SIZE * self.tile_size
+        # Экран, сдвинутый не на целое число кусков, задевает еще по куску с каждой стороны
+        visible = (self.screen_width // chunk_pixels + 2) * (self.screen_height // chunk_pixels + 2)
+        return CHUNK_CACHE_SCREENS * visible * chunk_pixels * chunk_pixels
+
+    def get_chunk_surface(self, chunk_x, chunk_y):
+        """Отрисованный кусок карты: фон, сетка и ресурсы (из кэша, если есть)"""
+        key = (chunk_x, chunk_y)
+        surface = self.terrain_chunks.get(key)
+        if surface is not None:
+            self.terrain_chunks.move_to_end(key)
+            return surface
+
+        self.world.ensure_chunk(chunk_x, chunk_y)
+
+        tile_size = self.tile_size
+        first_x = chunk_x * CHUNK_SIZE
+        first_y = chunk_y * CHUNK_SIZE
+        cols = min(CHUNK_SIZE, self.world.width - first_x)
+        rows = min(CHUNK_SIZE, self.world.height - first_y)
+        width, height = cols * tile_size, rows * tile_size
+
+        surface = pygame.Surface((width, height)).convert()
+        surface.fill(GREEN)
+        for x in range(0, width, tile_size):
+            pygame.draw.line(surface, GRAY, (x, 0), (x, height), 1)
+        for y in range(0, height, tile_size):
+            pygame.draw.line(surface, GRAY, (0, y), (width, y), 1)
+
+        tile_at = self.world.index.tile_at
+        for y in range(rows):
+            for x in range(cols):
+                tile = tile_at((first_x + x, first_y + y))
+                if tile:
+                    surface.blit(self.terrain_sprites[tile.kind], (x * tile_size, y * tile_size))
+
+        self.terrain_chunks[key] = surface
+        self.terrain_chunk_pixels += width * height
+        budget = self.chunk_cache_budget()
+        while self.terrain_chunk_pixels > budget and len(self.terrain_chunks) > 1:
+            _, old = self.terrain_chunks.popitem(last=False)
+            self.terrain_chunk_pixels -= old.get_width() * old.get_height()
+        return surface
+
+    def draw_terrain(self):
+        """Отрисовка только видимых кусков карты"""
+        chunk_pixels = CHUNK_SIZE * self.tile_size
+        world_width = self.world.width * self.tile_size
+        world_height = self.world.height * self.tile_size
+        if world_width - self.camera_x < self.screen_width or world_height - self.camera_y < self.screen_height:
+            # Карта не закрывает экран целиком
+            self.screen.fill(BLACK)
+
+        for chunk_x, chunk_y in self.visible_chunks():
+            self.screen.blit(self.get_chunk_surface(chunk_x, chunk_y),
+                             (chunk_x * chunk_pixels - self.camera_x, chunk_y * chunk_pixels - self.camera_y))
+
+    def visible_chunks(self, margin=0):
+        """Куски карты, попадающие на экран (margin - сколько кусков захватить слева и сверху)"""
+        chunk_pixels = CHUNK_SIZE * self.tile_size
+        first_x = max(0, self.camera_x // chunk_pixels - margin)
+        first_y = max(0, self.camera_y // chunk_pixels - margin)
+        last_x = min((self.camera_x + self.screen_width - 1) // chunk_pixels, (self.world.width - 1) // CHUNK_SIZE)
+        last_y = min((self.camera_y + self.screen_height - 1) // chunk_pixels, (self.world.height - 1) // CHUNK_SIZE)
+        return [(chunk_x, chunk_y) for chunk_y in range(first_y, last_y + 1) for chunk_x in range(first_x, last_x + 1)]
+
+    def get_entity_layers(self):
+        """Слои зданий и юнитов: последовательности (спрайт, позиция) для Surface.blits.
+
+        Собираются только из видимых кусков карты и только после изменения
+        сущностей, камеры или масштаба, а не каждый кадр.
+        """
+        key = (id(self.world), self.world.index.version, self.camera_x, self.camera_y,
+               self.tile_size, self.screen_width, self.screen_height)
+        if key == self.entity_layers_key:
+            return self.entity_layers
+
+        index = self.world.index
+        tile_size = self.tile_size
+        camera_x, camera_y = self.camera_x, self.camera_y
+        building_sprites = self.building_sprites
+        entity_sprite = self.get_entity_sprite
+        buildings = [
+            (entity_sprite(building_sprites, building), (building.x * tile_size - camera_x, building.y * tile_size - camera_y))
+            for chunk in self.visible_chunks()
+            for building in index.buildings_in_chunk(chunk)
+        ]
+
+        # Юниты сдвинуты внутри клетки и могут выступать из куска слева или сверху
+        offset_x, offset_y = self.unit_offset
+        unit_sprites = self.unit_sprites
+        units = [
+            (entity_sprite(unit_sprites, unit), (unit.x * tile_size - camera_x + offset_x, unit.y * tile_size - camera_y + offset_y))
+            for chunk in self.visible_chunks(margin=1)
+            for unit in index.units_in_chunk(chunk)
+        ]
 
-    def get_resource_type(self, image):
-        """Определение типа ресурса по изображению"""
-        if image == self.gelezo_image: return "Железо"
-        if image == self.medi_image: return "Медь"
-        if image == self.forest_image: return "Дерево"
-        if image == self.nefti_image: return "Нефть"
-        if image == self.pole_image: return "Поле"
-        if image == self.stone_image: return "Камень"
-        if image == self.components_image: return "компоненты"
-        return "Неизвестно"
+        self.entity_layers = (buildings, units)
+        self.entity_layers_key = key
+        return self.entity_layers
+
+    def update_tile_size(self):
+        """Размер клетки на экране с учетом масштаба"""
+        zoom = ZOOM_LEVELS[self.zoom_index]
+        self.tile_size = max(8, int(self.cell_size * zoom))
+        self.unit_offset = (int(UNIT_OFFSET[0] * zoom), int(UNIT_OFFSET[1] * zoom))
+
+    def screen_to_cell(self, pos):
+        """Клетка карты под точкой экрана"""
+        return ((pos[0] + self.camera_x) // self.tile_size, (pos[1] + self.camera_y) // self.tile_size)
+
+    def cell_to_screen(self, cell):
+        """Левый верхний угол клетки карты на экране"""
+        return (cell[0] * self.tile_size - self.camera_x, cell[1] * self.tile_size - self.camera_y)
+
+    def clamp_camera(self):
+        """Камера не выходит за края карты"""
+        max_x = max(0, self.world.width * self.tile_size - self.screen_width)
+        max_y = max(0, self.world.height * self.tile_size - self.screen_height)
+        self.camera_x = min(max(0, int(self.camera_x)), max_x)
+        self.camera_y = min(max(0, int(self.camera_y)), max_y)
+
+    def center_camera_on(self, cell_x, cell_y):
+        """Поставить точку карты (в клетках, можно дробных) в центр экрана"""
+        self.camera_x = cell_x * self.tile_size - self.screen_width / 2
+        self.camera_y = cell_y * self.tile_size - self.screen_height / 2
+        self.clamp_camera()
+
+    def move_camera(self, dx, dy):
+        """Прокрутка карты на (dx, dy) пикселей"""
+        old_camera = (self.camera_x, self.camera_y)
+        self.camera_x += dx
+        self.camera_y += dy
+        self.clamp_camera()
+        if (self.camera_x, self.camera_y) != old_camera:
+            self.mark_dirty()
+
+    def set_zoom(self, zoom_index, anchor=None):
+        """Смена масштаба; точка карты под anchor остается на месте"""
+        zoom_index = min(max(0, zoom_index), len(ZOOM_LEVELS) - 1)
+        if zoom_index == self.zoom_index:
+            return
+        if anchor is None:
+            anchor = (self.screen_width // 2, self.screen_height // 2)
+
+        world_x = (anchor[0] + self.camera_x) / self.tile_size
+        world_y = (anchor[1] + self.camera_y) / self.tile_size
+        self.zoom_index = zoom_index
+        self.update_tile_size()
+        self.camera_x = world_x * self.tile_size - anchor[0]
+        self.camera_y = world_y * self.tile_size - anchor[1]
+        self.clamp_camera()
+
+        self.update_map_sprites()
+        self.invalidate_terrain()
+        self.mark_dirty()
+
+    def update_camera(self):
+        """Прокрутка карты стрелками или WASD"""
+        dx, dy = self.camera_direction()
+        if dx or dy:
+            self.move_camera(dx * SCROLL_SPEED, dy * SCROLL_SPEED)
+
+    def camera_direction(self):
+        """Направление прокрутки по зажатым клавишам: (dx, dy) из -1, 0, 1"""
+        keys = pygame.key.get_pressed()
+        right, left, down, up = (keys[a] or keys[b] for a, b in CAMERA_KEYS)
+        return right - left, down - up
 
     def can_afford_building(self, building_type):
         """Проверка, хватает ли ресурсов для постройки"""
-        if building_type not in self.building_costs:
+        if building_type not in BUILDING_IDS:
             return False
-
-        for resource, amount in self.building_costs[building_type].items():
-            if self.player_resources.get(resource, 0) < amount:
-                return False
-        return True
+        return self.world.can_afford_building(BUILDING_IDS[building_type])
 
     def can_afford_upkeep(self, building_type):
         """Проверка, хватает ли ресурсов для содержания здания"""
-        if building_type not in self.building_upkeep:
+        if building_type not in BUILDING_IDS:
             return True
-
-        for resource, amount in self.building_upkeep[building_type].items():
-            if self.player_resources.get(resource, 0) < amount:
-                return False
-        return True
+        return self.world.can_afford_upkeep(BUILDING_IDS[building_type])
 
     def can_afford_unit(self, unit_type):
         """Проверка, хватает ли ресурсов для создания юнита"""
-        if unit_type not in self.unit_costs:
+        if unit_type not in UNIT_IDS:
             return False
-
-        for resource, amount in self.unit_costs[unit_type].items():
-            if self.player_resources.get(resource, 0) < amount:
-                return False
-        return True
-
-    def deduct_building_cost(self, building_type):
-        """Вычитание ресурсов за постройку"""
-        if building_type in self.building_costs:
-            for resource, amount in self.building_costs[building_type].items():
-                self.player_resources[resource] -= amount
-
-    def deduct_unit_cost(self, unit_type):
-        """Вычитание ресурсов за создание юнита"""
-        if unit_type in self.unit_costs:
-            for resource, amount in self.unit_costs[unit_type].items():
-                self.player_resources[resource] -= amount
+        return self.world.can_afford_unit(UNIT_IDS[unit_type])
 
     def get_building_production(self, building_type):
         """Возвращает информацию о производстве здания"""
@@ -393,381 +1052,524 @@ class Game:
         
         return production_info.strip() if production_info else "Нет производства"
 
-    def handle_events(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                return False
+    def register_handlers(self):
+        """Таблица обработчиков событий: состояние -> {тип события: метод}.
+
+        Выход, фокус окна и клавиши обрабатываются во всех состояниях
+        в handle_events, остальное - по этой таблице.
+        """
+        self.event_handlers = {
+            MAIN_MENU: {pygame.MOUSEBUTTONDOWN: self.on_widget_click},
+            GAME_SCREEN: {
+                pygame.MOUSEBUTTONDOWN: self.on_game_mouse_down,
+                pygame.MOUSEBUTTONUP: self.on_game_mouse_up,
+                pygame.MOUSEMOTION: self.on_game_motion,
+                pygame.MOUSEWHEEL: self.on_game_wheel,
+            },
+            MOL_MENU: {pygame.MOUSEBUTTONDOWN: self.on_widget_click},
+            SETTINGS_MENU: {pygame.MOUSEBUTTONDOWN: self.on_widget_click},
+        }
 
-            if event.type == pygame.KEYDOWN:
-                if event.key == pygame.K_ESCAPE:
-                    return False
-
-            if event.type == pygame.MOUSEBUTTONDOWN:
-                if event.button == 1:
-                    mouse_pos = pygame.mouse.get_pos()
-
-                    if self.state == MAIN_MENU:
-                        play_rect = self.play_button.get_rect(center=(self.screen_width // 2, self.screen_height // 2))
-                        if play_rect.collidepoint(mouse_pos):
-                            self.state = GAME_SCREEN
-                        elif self.settings_button_rect.collidepoint(mouse_pos):
-                            self.state = SETTINGS_MENU
-
-                    elif self.state == GAME_SCREEN:
-                        if self.mol_button_rect.collidepoint(mouse_pos):
-                            self.state = MOL_MENU
-                        elif self.end_turn_button_rect.collidepoint(mouse_pos):
-                            self.end_turn()
-                        else:
-                            if self.selected_building:
-                                self.try_build_building(mouse_pos, self.selected_building)
-                            self.try_create_soldier(mouse_pos)
-
-                    elif self.state == MOL_MENU:
-                        close_rect = pygame.Rect(self.mol_menu_rect.right - 30, self.mol_menu_rect.y + 10, 20, 20)
-                        if close_rect.collidepoint(mouse_pos):
-                            self.state = GAME_SCREEN
-                            self.selected_building = None
-                        else:
-                            button_size = 80
-                            button_margin = 20
-                            start_x = self.mol_menu_rect.x + 50
-                            start_y = self.mol_menu_rect.y + 80
-                            
-                            building_buttons = [
-                                {"rect": pygame.Rect(start_x, start_y, button_size, button_size), "type": "Завод"},
-                                {"rect": pygame.Rect(start_x + button_size + button_margin, start_y, button_size, button_size), "type": "Лаборатория"},
-                                {"rect": pygame.Rect(start_x + (button_size + button_margin) * 2, start_y, button_size, button_size), "type": "Нефтяная вышка"},
-                                {"rect": pygame.Rect(start_x + (button_size + button_margin) * 3, start_y, button_size, button_size), "type": "Лесопилка"},
-                                {"rect": pygame.Rect(start_x, start_y + button_size + 80, button_size, button_size), "type": "Военный завод"},
-                                {"rect": pygame.Rect(start_x + button_size + button_margin, start_y + button_size + 80, button_size, button_size), "type": "Железная шахта"},
-                                {"rect": pygame.Rect(start_x + (button_size + button_margin) * 2, start_y + button_size + 80, button_size, button_size), "type": "Каменная шахта"},
-                                {"rect": pygame.Rect(start_x + (button_size + button_margin) * 3, start_y + button_size + 80, button_size, button_size), "type": "Медная шахта"}
-                            ]
-
-                            for button in building_buttons:
-                                if button["rect"].collidepoint(mouse_pos):
-                                    if self.can_afford_building(button["type"]):
-                                        print(f"Выбрана постройка: {button['type']}")
-                                        self.selected_building = button["type"]
-                                        self.state = GAME_SCREEN
-                                    else:
-                                        print(f"Не хватает ресурсов для постройки {button['type']}")
-                                    break
-
-                    elif self.state == SETTINGS_MENU:
-                        close_rect = pygame.Rect(self.mol_menu_rect.right - 30, self.mol_menu_rect.y + 10, 20, 20)
-                        if close_rect.collidepoint(mouse_pos):
-                            self.state = MAIN_MENU
-                        
-                        resolution_buttons = []
-                        for i, resolution in enumerate(RESOLUTIONS):
-                            button_rect = pygame.Rect(
-                                self.mol_menu_rect.x + 50,
-                                self.mol_menu_rect.y + 60 + i * 60,
-                                self.mol_menu_rect.width - 100,
-                                50
-                            )
-                            resolution_buttons.append({"rect": button_rect, "index": i})
-                        
-                        for button in resolution_buttons:
-                            if button["rect"].collidepoint(mouse_pos):
-                                self.change_resolution(button["index"])
-                                break
-
-            if self.state == MOL_MENU:
-                mouse_pos = pygame.mouse.get_pos()
-                self.hovered_building = None
-                
-                button_size = 80
-                button_margin = 20
-                start_x = self.mol_menu_rect.x + 50
-                start_y = self.mol_menu_rect.y + 80
-                
-                building_buttons = [
-                    {"rect": pygame.Rect(start_x, start_y, button_size, button_size), "type": "Завод"},
-                    {"rect": pygame.Rect(start_x + button_size + button_margin, start_y, button_size, button_size), "type": "Лаборатория"},
-                    {"rect": pygame.Rect(start_x + (button_size + button_margin) * 2, start_y, button_size, button_size), "type": "Нефтяная вышка"},
-                    {"rect": pygame.Rect(start_x + (button_size + button_margin) * 3, start_y, button_size, button_size), "type": "Лесопилка"},
-                    {"rect": pygame.Rect(start_x, start_y + button_size + 80, button_size, button_size), "type": "Военный завод"},
-                    {"rect": pygame.Rect(start_x + button_size + button_margin, start_y + button_size + 80, button_size, button_size), "type": "Железная шахта"},
-                    {"rect": pygame.Rect(start_x + (button_size + button_margin) * 2, start_y + button_size + 80, button_size, button_size), "type": "Каменная шахта"},
-                    {"rect": pygame.Rect(start_x + (button_size + button_margin) * 3, start_y + button_size + 80, button_size, button_size), "type": "Медная шахта"}
-                ]
-                
-                for button in building_buttons:
-                    if button["rect"].collidepoint(mouse_pos):
-                        self.hovered_building = button["type"]
-                        break
+    def build_widgets(self):
+        """Кнопки каждого состояния для поиска под курсором: состояние -> WidgetGrid"""
+        main_menu = WidgetGrid()
+        main_menu.add(self.play_button_rect, "set_state", (GAME_SCREEN,))
+        main_menu.add(self.settings_button_rect, "set_state", (SETTINGS_MENU,))
 
-        return True
+        game_screen = WidgetGrid()
+        game_screen.add(self.mol_button_rect, "set_state", (MOL_MENU,))
+        game_screen.add(self.end_turn_button_rect, "end_turn")
 
-    def try_build_building(self, mouse_pos, building_type):
-        """Попытка построить здание"""
-        grid_x = (mouse_pos[0] // self.cell_size) * self.cell_size
-        grid_y = (mouse_pos[1] // self.cell_size) * self.cell_size
+        build_menu = WidgetGrid()
+        build_menu.add(self.close_button_rect, "close_build_menu")
+        for button in self.menu_buttons:
+            build_menu.add(button["rect"], "choose_building", (button["type"],), hover=button["type"])
 
-        for building in self.buildings:
-            if building['pos'] == (grid_x, grid_y):
-                return
+        settings_menu = WidgetGrid()
+        settings_menu.add(self.close_button_rect, "set_state", (MAIN_MENU,))
+        for i, button_rect in enumerate(self.resolution_buttons):
+            settings_menu.add(button_rect, "change_resolution", (i,))
 
-        # Проверки для специальных зданий
-        if building_type == "Железная шахта":
-            can_build = False
-            for resource in self.resources:
-                if resource['pos'] == (grid_x, grid_y) and resource['type'] == "Железо":
-                    can_build = True
-                    break
-            if not can_build:
-                return
-        
-        elif building_type == "Лесопилка":
-            can_build = False
-            for resource in self.resources:
-                if resource['pos'] == (grid_x, grid_y) and resource['type'] == "Дерево":
-                    can_build = True
-                    break
-            if not can_build:
-                return
-        
-        elif building_type == "Нефтяная вышка":
-            can_build = False
-            for resource in self.resources:
-                if resource['pos'] == (grid_x, grid_y) and resource['type'] == "Нефть":
-                    can_build = True
-                    break
-            if not can_build:
-                return
-        
-        elif building_type == "Каменная шахта":
-            can_build = False
-            for resource in self.resources:
-                if resource['pos'] == (grid_x, grid_y) and resource['type'] == "Камень":
-                    can_build = True
-                    break
-            if not can_build:
-                return
-        
-        elif building_type == "Медная шахта":
-            can_build = False
-            for resource in self.resources:
-                if resource['pos'] == (grid_x, grid_y) and resource['type'] == "Медь":
-                    can_build = True
-                    break
-            if not can_build:
-                return
-        
-        else:
-            for resource in self.resources:
-                if resource['pos'] == (grid_x, grid_y):
-                    return
+        return {MAIN_MENU: main_menu, GAME_SCREEN: game_screen, MOL_MENU: build_menu, SETTINGS_MENU: settings_menu}
 
+    def set_state(self, state):
+        self.state = state
+
+    def close_build_menu(self):
+        self.state = GAME_SCREEN
+        self.selected_building = None
+
+    def choose_building(self, building_type):
         if self.can_afford_building(building_type):
-            self.buildings.append({
-                'image': self.building_images[building_type],
-                'pos': (grid_x, grid_y),
-                'type': building_type
-            })
-            self.deduct_building_cost(building_type)
+            log.debug("Выбрана постройка: %s", building_type, extra={"event": "choose_building", "data": {"building": building_type}})
+            self.selected_building = building_type
+            self.state = GAME_SCREEN
+        else:
+            log.info("Не хватает ресурсов для постройки %s", building_type, extra={"event": "cannot_afford", "data": {"building": building_type}})
+
+    def click_widget(self, pos):
+        """Нажатие на кнопку текущего состояния под pos; False, если кнопки там нет"""
+        widgets = self.widgets.get(self.state)
+        widget = widgets.at(pos) if widgets else None
+        if widget is None:
+            return False
+        # Метод берется по имени - так срабатывают и обертки профайлера
+        getattr(self, widget.action)(*widget.args)
+        return True
+
+    def on_widget_click(self, event):
+        if event.button == 1:
+            self.click_widget(event.pos)
+
+    def on_game_mouse_down(self, event):
+        if event.button == 3:
+            self.order_drag = 0
+        elif event.button == 1 and not self.click_widget(event.pos):
+            if self.selected_building:
+                self.try_build_building(event.pos, self.selected_building)
+            else:
+                # Выделение юнитов - щелчком или рамкой до отпускания кнопки
+                self.selection_start = event.pos
+            self.try_create_soldier(event.pos)
+
+    def on_game_mouse_up(self, event):
+        if event.button == 3:
+            if self.order_drag is not None and self.order_drag < CLICK_SLOP:
+                self.order_selected(self.screen_to_cell(event.pos))
+            self.order_drag = None
+        elif event.button == 1 and self.selection_start:
+            self.select_units(self.selection_start, event.pos, pygame.key.get_mods() & pygame.KMOD_SHIFT)
+            self.selection_start = None
+
+    def on_game_motion(self, event):
+        if event.buttons[1] or event.buttons[2]:
+            # Перетаскивание карты средней или правой кнопкой
+            self.move_camera(-event.rel[0], -event.rel[1])
+            if self.order_drag is not None:
+                self.order_drag += abs(event.rel[0]) + abs(event.rel[1])
+        elif self.selection_start:
+            self.mark_dirty()
+
+    def on_game_wheel(self, event):
+        self.set_zoom(self.zoom_index + event.y, pygame.mouse.get_pos())
+
+    def dispatch(self, event):
+        handler = self.event_handlers[self.state].get(event.type)
+        if handler:
+            handler(event)
+
+    def update_hover(self, pos):
+        """Здание под курсором в меню построек - один раз за кадр, а не на каждое событие"""
+        widget = self.widgets[MOL_MENU].at(pos)
+        hovered = widget.hover if widget else None
+        if hovered != self.hovered_building:
+            self.hovered_building = hovered
+            self.mark_dirty()
+
+    def handle_events(self, events=None):
+        if events is None:
+            events = pygame.event.get()
+        # Подряд идущие движения мыши сливаются в одно: смещения складываются
+        motion = None
+        mouse_pos = None
+        for event in events:
+            if event.type == pygame.MOUSEMOTION:
+                if motion is None:
+                    motion = event
+                else:
+                    motion = pygame.event.Event(pygame.MOUSEMOTION, pos=event.pos, buttons=event.buttons, rel=(
+                        motion.rel[0] + event.rel[0], motion.rel[1] + event.rel[1]
+                    ))
+                continue
+            if motion is not None:
+                self.handle_event(motion)
+                mouse_pos = motion.pos
+                motion = None
+            if not self.handle_event(event):
+                return False
+        if motion is not None:
+            self.handle_event(motion)
+            mouse_pos = motion.pos
+
+        if self.state == MOL_MENU and (mouse_pos or self.hover_state != MOL_MENU):
+            self.update_hover(mouse_pos or pygame.mouse.get_pos())
+        self.hover_state = self.state
+        return True
+
+    def handle_event(self, event):
+        """Одно событие; False - выход из игры"""
+        if event.type == pygame.QUIT:
+            return False
+
+        # Без фокуса или свернутое окно не перерисовывается
+        if event.type in (pygame.WINDOWFOCUSLOST, pygame.WINDOWMINIMIZED, pygame.WINDOWHIDDEN):
+            self.window_focused = False
+        elif event.type in (pygame.WINDOWFOCUSGAINED, pygame.WINDOWRESTORED, pygame.WINDOWSHOWN):
+            self.window_focused = True
+            self.mark_dirty()
+
+        # Окно перекрыто/восстановлено или открыто меню - перерисовываем все
+        if event.type == pygame.VIDEOEXPOSE or self.state != GAME_SCREEN:
+            self.mark_dirty()
+
+        if event.type == pygame.KEYDOWN:
+            if event.key == pygame.K_ESCAPE:
+                return False
+            elif event.key == pygame.K_F5 and self.state == GAME_SCREEN:
+                self.save_world()
+            elif event.key == pygame.K_F9 and self.state in (MAIN_MENU, GAME_SCREEN):
+                self.load_world()
+            elif event.key == pygame.K_F3:
+                self.toggle_profiler()
+            elif event.key == pygame.K_F4:
+                self.dump_profile()
+            return True
+
+        self.dispatch(event)
+        return True
+
+    def try_build_building(self, mouse_pos, building_type):
+        """Попытка построить здание"""
+        cell = self.screen_to_cell(mouse_pos)
+        building = self.world.build(cell, BUILDING_IDS[building_type])
+        if building:
+            self.record_command(BUILD, cell, building.kind)
+            self.mark_dirty(self.entity_rect(building))
+            self.mark_dirty(self.resource_panel_rect)
             self.selected_building = None
 
     def try_create_soldier(self, mouse_pos):
         """Попытка создать солдата на военном заводе"""
-        grid_x = (mouse_pos[0] // self.cell_size) * self.cell_size
-        grid_y = (mouse_pos[1] // self.cell_size) * self.cell_size
-
-        for building in self.buildings:
-            if building['pos'] == (grid_x, grid_y) and building['type'] == "Военный завод":
-                if self.can_afford_unit("Солдат"):
-                    soldier_pos = (grid_x + self.cell_size + 10, grid_y)
-                    self.military_units.append({
-                        'image': self.soldat_image,
-                        'pos': soldier_pos,
-                        'type': 'Солдат'
-                    })
-                    self.deduct_unit_cost("Солдат")
-                break
+        cell = self.screen_to_cell(mouse_pos)
+        unit = self.world.recruit(cell)
+        if unit:
+            self.record_command(RECRUIT, cell, unit.kind)
+            self.mark_dirty(self.entity_rect(unit, self.unit_offset))
+            self.mark_dirty(self.resource_panel_rect)
+
+    def select_units(self, start, end, add=False):
+        """Выделение своих юнитов в клетках рамки от start до end (точки экрана)"""
+        first = self.screen_to_cell((min(start[0], end[0]), min(start[1], end[1])))
+        last = self.screen_to_cell((max(start[0], end[0]), max(start[1], end[1])))
+        selected = set(self.selected_units) if add else set()
+        for number, unit in enumerate(self.world.units):
+            if unit.owner == PLAYER and first[0] <= unit.x <= last[0] and first[1] <= unit.y <= last[1]:
+                selected.add(number)
+        self.selected_units = sorted(selected)
+        self.mark_dirty()
+
+    def order_selected(self, cell):
+        """Приказ выделенным юнитам идти на клетку"""
+        if not self.selected_units:
+            return
+        ordered = 0
+        for number in self.selected_units:
+            if self.world.order_move(number, cell):
+                self.record_command(MOVE, cell, number)
+                ordered += 1
+        if not ordered:
+            log.info("Туда юнитам не пройти", extra={"event": "no_path", "data": {"cell": cell}})
+
+    def entity_rect(self, entity, offset=(0, 0)):
+        """Прямоугольник на экране для клетки здания или юнита"""
+        x, y = self.cell_to_screen((entity.x, entity.y))
+        return pygame.Rect(x + offset[0], y + offset[1], self.tile_size, self.tile_size)
 
     def end_turn(self):
         """Пропуск хода - производство ресурсов и потребление"""
-        for building in self.buildings:
-            building_type = building['type']
-            
-            if building_type in self.building_upkeep:
-                can_afford_upkeep = True
-                
-                for resource, amount in self.building_upkeep[building_type].items():
-                    if self.player_resources.get(resource, 0) < amount:
-                        can_afford_upkeep = False
-                        break
-                
-                if can_afford_upkeep:
-                    for resource, amount in self.building_upkeep[building_type].items():
-                        self.player_resources[resource] -= amount
-                        print(f"Завод потребил {amount} {resource}")
-                else:
-                    print(f"Не хватает ресурсов для содержания {building_type}!")
+        if self.ai and self.ai.thinking():
+            # Ход закончится, когда планы противников будут применены
+            log.info("Противники еще планируют свой ход - ход закончится после них")
+            self.end_turn_queued = True
+            return
+        units_version = self.world.units_version
+        upkeep_report = self.world.end_turn()
+        self.record_command(END_TURN)
+        if self.world.units_version != units_version:
+            # Юниты прошли по карте
+            self.mark_dirty()
+
+        self.log_turn(upkeep_report)
+        self.mark_dirty(self.resource_panel_rect)
+        self.mark_dirty(self.turn_label_rect)
+
+        if self.autosaver:
+            self.autosaver.save(self.world)
+        if self.replay_log:
+            self.replay_log.flush()
+        if self.ai:
+            self.ai.start_turn(self.world)
+
+    def log_turn(self, upkeep_report):
+        """Итог хода в журнал: потребление и производство по ресурсам, нехватки - предупреждением.
+
+        Суммы считаются по типам зданий, а не по зданиям.
+        """
+        turn = self.world.turn_count - 1
+        upkeep = {}
+        shortages = {}
+        for kind, (paid, skipped) in upkeep_report.items():
+            building_type = BUILDING_NAMES[kind]
+            for resource, amount in self.building_upkeep[building_type].items():
+                upkeep[resource] = upkeep.get(resource, 0) + amount * paid
+            if skipped:
+                shortages[building_type] = skipped
+        production = {}
+        for kind, count in self.world.economy.counts.items():
+            for resource, amount in self.building_production.get(BUILDING_NAMES[kind], {}).items():
+                production[resource] = production.get(resource, 0) + amount * count
+
+        if log.isEnabledFor(logging.INFO):
+            log.info(
+                "Ход %d: потреблено %s, произведено %s", turn,
+                ", ".join(f"{amount} {resource}" for resource, amount in upkeep.items()) or "ничего",
+                ", ".join(f"{amount} {resource}" for resource, amount in production.items()) or "ничего",
+                extra={"event": "turn", "data": {"turn": turn, "upkeep": upkeep, "production": production}}
+            )
+        if shortages:
+            log.warning(
+                "Не хватает ресурсов для содержания: %s",
+                ", ".join(f"{building_type} x{count}" for building_type, count in shortages.items()),
+                extra={"event": "upkeep_shortage", "data": {"turn": turn, "buildings": shortages}}
+            )
 
-        for building in self.buildings:
-            building_type = building['type']
-            
-            if building_type in self.building_production:
-                for resource, amount in self.building_production[building_type].items():
-                    self.player_resources[resource] += amount
-                    print(f"{building_type} произвел {amount} {resource}")
+    def start_ai(self):
+        """Планировщик для фракций-противников текущей партии"""
+        if self.ai:
+            self.ai.close()
+        owners = range(PLAYER + 1, len(self.world.factions))
+        self.ai = AIController(owners) if owners else None
+        self.end_turn_queued = False
+
+    def update_ai(self):
+        """Применение готовых планов противников (по порядку фракций) и отложенного конца хода"""
+        plans = self.ai.poll()
+        if plans is None:
+            return
+        for owner, moves in plans:
+            for op, x, y, arg in moves:
+                entity = apply_command(self.world, op, owner, x, y, arg)
+                if entity is None:
+                    continue
+                self.record_command(op, (x, y), arg, owner)
+                self.mark_dirty(self.entity_rect(entity, self.unit_offset if op == RECRUIT else (0, 0)))
+        # Команды тратят запасы
+        self.mark_dirty(self.resource_panel_rect)
+        if self.end_turn_queued:
+            self.end_turn_queued = False
+            self.end_turn()
+        # Под открытым меню изменились здания и запасы - снимок экрана под ним сделается заново
+        self.menu_background = None
+
+    def start_replay_log(self):
+        """Новый журнал команд с текущего состояния партии"""
+        try:
+            path = new_log_path(os.path.join(self.save_dir, "replays"))
+        except OSError as e:
+            log.error("Не удалось создать папку журналов: %s", e)
+            self.replay_log = None
+            return
+        self.replay_log = ReplayLog(path, self.world)
+
+    def record_command(self, op, cell=(0, 0), arg=0, owner=PLAYER):
+        """Запись команды, изменившей партию, в журнал"""
+        if self.replay_log:
+            self.replay_log.record(op, cell[0], cell[1], arg, owner)
+
+    def save_world(self, path=None):
+        """Сохранение партии в файл (по умолчанию - быстрое сохранение)"""
+        path = path or self.quicksave_path
+        try:
+            save_game(self.world, path)
+        except OSError as e:
+            log.error("Не удалось сохранить игру в %s: %s", path, e, extra={"event": "save_failed", "data": {"path": path}})
+            return False
+        log.info("Игра сохранена: %s", path, extra={"event": "save", "data": {"path": path}})
+        return True
+
+    def load_world(self, path=None):
+        """Загрузка партии из файла (по умолчанию - быстрое сохранение)"""
+        path = path or self.quicksave_path
+        try:
+            world = load_game(path)
+        except (OSError, ValueError) as e:
+            log.error("Не удалось загрузить игру из %s: %s", path, e, extra={"event": "load_failed", "data": {"path": path}})
+            return False
+
+        # Журнал старой партии закрывается, новый начинается с загруженной
+        if self.replay_log:
+            self.replay_log.close(self.world)
+        self.world = world
+        self.selected_units = []
+        self.start_ai()
+        if self.autosaver:
+            self.autosaver.reset()
+        if self.replay_log:
+            self.start_replay_log()
+        self.selected_building = None
+        self.clamp_camera()
+        self.invalidate_terrain()
+        self.state = GAME_SCREEN
+        self.mark_dirty()
+        log.info(
+            "Игра загружена: %s, ход %d", path, world.turn_count,
+            extra={"event": "load", "data": {"path": path, "turn": world.turn_count}}
+        )
+        return True
 
-        self.turn_count += 1
+    def update_loading(self):
+        """Подставляет догруженные картинки вместо заглушек, по одной по мере готовности"""
+        finished = self.assets.poll_loading()
+        if finished:
+            self.replace_images(finished)
+        progress = self.assets.loading_progress()
+        if progress != self.loading_progress:
+            self.loading_progress = progress
+            # Последний кадр стирает полосу - экран перерисовывается целиком
+            self.mark_dirty(self.loading_bar_rect if self.assets.is_loading() else None)
+
+    def replace_images(self, filenames):
+        """Обновление копий картинок filenames (иконки атласа уже заменены на месте)"""
+        filenames = set(filenames)
+        bg_size, button_size, _, panel_icon_size = self.image_sizes()
+        if "bg_image.png" in filenames:
+            self.bg_image = self.assets.get("bg_image.png", bg_size)
+        if "Play.png" in filenames:
+            self.play_button = self.assets.get("Play.png", button_size)
+        if "settings.png" in filenames:
+            self.settings_image = self.assets.get("settings.png", button_size)
+        if filenames & {filename for filename, _ in PANEL_RESOURCES}:
+            self.panel_icons = [
+                (self.assets.get(filename, (panel_icon_size, panel_icon_size)), resource_name)
+                for filename, resource_name in PANEL_RESOURCES
+            ]
+        if filenames & MAP_FILES:
+            self.update_map_sprites()
+            self.invalidate_terrain()
+        # Снимок экрана под меню мог захватить заглушки
+        self.menu_background = None
+        self.mark_dirty()
+
+    def draw_loading_bar(self):
+        """Полоса загрузки картинок поверх экрана"""
+        bar_rect = self.loading_bar_rect
+        pygame.draw.rect(self.screen, DARK_BLUE, bar_rect)
+        fill_rect = pygame.Rect(bar_rect.x, bar_rect.y, int(bar_rect.width * self.loading_progress), bar_rect.height)
+        pygame.draw.rect(self.screen, LIGHT_BLUE, fill_rect)
+        pygame.draw.rect(self.screen, WHITE, bar_rect, 1)
 
     def draw_main_menu(self):
         """Отрисовка главного меню"""
         self.screen.blit(self.bg_image, (0, 0))
 
-        play_rect = self.play_button.get_rect(center=(self.screen_width // 2, self.screen_height // 2))
-        self.screen.blit(self.play_button, play_rect)
+        self.screen.blit(self.play_button, self.play_button.get_rect(center=self.play_button_rect.center))
 
         self.screen.blit(self.settings_image, self.settings_button_rect.topleft)
 
-        title_font = pygame.font.Font(None, self.font_size_title)
-        title = title_font.render("vektor ", True, WHITE)
+        title = self.text_cache.render("vektor ", self.font_size_title, WHITE)
         self.screen.blit(title, (self.screen_width // 2 - title.get_width() // 2, 100))
 
     def draw_game_screen(self):
         """Отрисовка игрового экрана"""
-        self.screen.fill(GREEN)
-        
-        for x in range(0, self.screen_width, self.cell_size):
-            pygame.draw.line(self.screen, GRAY, (x, 0), (x, self.screen_height), 1)
-        for y in range(0, self.screen_height, self.cell_size):
-            pygame.draw.line(self.screen, GRAY, (0, y), (self.screen_width, y), 1)
+        # Сетка и ресурсы - из готовых кусков карты, только видимые
+        self.draw_terrain()
 
         self.screen.blit(self.corner_image, self.corner_pos)
         self.screen.blit(self.corner1_image, self.corner1_pos)
 
-        for resource in self.resources:
-            self.screen.blit(resource['image'], resource['pos'])
-
-        for building in self.buildings:
-            self.screen.blit(building['image'], building['pos'])
-
-        for unit in self.military_units:
-            self.screen.blit(unit['image'], unit['pos'])
+        # Здания и юниты - одним вызовом blits на слой
+        for layer in self.get_entity_layers():
+            self.screen.blits(layer, doreturn=False)
+        self.draw_selection()
 
         self.screen.blit(self.mol_image, self.mol_button_rect.topleft)
 
         pygame.draw.rect(self.screen, LIGHT_BLUE, self.end_turn_button_rect)
         pygame.draw.rect(self.screen, WHITE, self.end_turn_button_rect, 2)
-        font = pygame.font.Font(None, self.font_size_medium)
-        text = font.render("Пропуск хода", True, WHITE)
+        text = self.text_cache.render("Пропуск хода", self.font_size_medium, WHITE)
         text_rect = text.get_rect(center=self.end_turn_button_rect.center)
         self.screen.blit(text, text_rect)
 
-        turn_font = pygame.font.Font(None, self.font_size_large)
-        turn_text = turn_font.render(f"Ход: {self.turn_count}", True, WHITE)
+        turn_text = self.text_cache.render(f"Ход: {self.world.turn_count}", self.font_size_large, WHITE)
         self.screen.blit(turn_text, (20, 20))
 
         self.draw_resource_panel()
 
-        if self.selected_building:
-            mouse_pos = pygame.mouse.get_pos()
-            grid_x = (mouse_pos[0] // self.cell_size) * self.cell_size
-            grid_y = (mouse_pos[1] // self.cell_size) * self.cell_size
-
-            building_image = self.building_images[self.selected_building].copy()
-            building_image.set_alpha(128)
-            self.screen.blit(building_image, (grid_x, grid_y))
+        preview_rect = self.get_preview_rect()
+        if preview_rect:
+            self.screen.blit(self.get_ghost_sprite(BUILDING_IDS[self.selected_building]), preview_rect.topleft)
+
+    def draw_selection(self):
+        """Рамки выделенных юнитов и рамка выделения мышью"""
+        units = self.world.units
+        screen_rect = self.screen.get_rect()
+        for number in self.selected_units:
+            rect = self.entity_rect(units[number], self.unit_offset)
+            if rect.colliderect(screen_rect):
+                pygame.draw.rect(self.screen, GREEN, rect, 2)
+
+        if self.selection_start:
+            x, y = self.selection_start
+            mouse_x, mouse_y = pygame.mouse.get_pos()
+            rect = pygame.Rect(min(x, mouse_x), min(y, mouse_y), abs(mouse_x - x), abs(mouse_y - y))
+            pygame.draw.rect(self.screen, WHITE, rect, 1)
 
     def draw_resource_panel(self):
         """Отрисовка панели ресурсов справа"""
-        panel_width = max(200, self.screen_width // 8)
-        panel_height = max(300, self.screen_height // 2)
-        panel_rect = pygame.Rect(self.screen_width - panel_width - 20, 60, panel_width, panel_height)
+        panel_rect = self.resource_panel_rect
         pygame.draw.rect(self.screen, DARK_BLUE, panel_rect)
         pygame.draw.rect(self.screen, WHITE, panel_rect, 2)
 
-        font = pygame.font.Font(None, self.font_size_large)
-        title = font.render("Ресурсы", True, WHITE)
+        title = self.text_cache.render("Ресурсы", self.font_size_large, WHITE)
         self.screen.blit(title, (panel_rect.centerx - title.get_width() // 2, panel_rect.y + 10))
 
-        resources_list = [
-            (self.gelezo_image, "Железо"),
-            (self.medi_image, "Медь"),
-            (self.nefti_image, "Нефть"),
-            (self.stone_image, "Камень"),
-            (self.forest_image, "Дерево"),
-            (self.components_image, "компоненты")
-        ]
-
         y_offset = panel_rect.y + 50
-        icon_size = max(30, self.cell_size - 10)
-        for image, resource_name in resources_list:
-            icon_rect = pygame.Rect(panel_rect.x + 10, y_offset, icon_size, icon_size)
-            self.screen.blit(pygame.transform.scale(image, (icon_size, icon_size)), icon_rect)
+        icon_size = self.panel_icon_size
+        for image, resource_name in self.panel_icons:
+            self.screen.blit(image, (panel_rect.x + 10, y_offset))
 
-            text = font.render(f"{resource_name}: {self.player_resources.get(resource_name, 0)}", True, WHITE)
+            text = self.text_cache.render(f"{resource_name}: {self.world.get_resource(resource_name)}", self.font_size_large, WHITE)
             self.screen.blit(text, (panel_rect.x + icon_size + 20, y_offset + icon_size // 3))
 
             y_offset += icon_size + 15
 
     def draw_mol_menu(self):
         """Отрисовка меню MOL"""
-        self.draw_game_screen()
-
-        overlay = pygame.Surface((self.screen_width, self.screen_height), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
-        self.screen.blit(overlay, (0, 0))
+        self.draw_menu_background(self.draw_game_screen)
 
         pygame.draw.rect(self.screen, DARK_BLUE, self.mol_menu_rect)
         pygame.draw.rect(self.screen, WHITE, self.mol_menu_rect, 2)
 
-        font = pygame.font.Font(None, self.font_size_title)
-        title = font.render("Меню построек", True, WHITE)
+        title = self.text_cache.render("Меню построек", self.font_size_title, WHITE)
         self.screen.blit(title, (self.mol_menu_rect.centerx - title.get_width() // 2,
                                  self.mol_menu_rect.y + 20))
 
-        button_size = 80
-        button_margin = 20
-        start_x = self.mol_menu_rect.x + 50
-        start_y = self.mol_menu_rect.y + 80
-        
-        buttons = [
-            {"image": self.zavod_image, "pos": (start_x, start_y), "text": "Завод", "type": "Завод"},
-            {"image": self.ibrari_image, "pos": (start_x + button_size + button_margin, start_y), "text": "Лаборатория", "type": "Лаборатория"},
-            {"image": self.fika_image, "pos": (start_x + (button_size + button_margin) * 2, start_y), "text": "Нефтяная вышка", "type": "Нефтяная вышка"},
-            {"image": self.losplka_image, "pos": (start_x + (button_size + button_margin) * 3, start_y), "text": "Лесопилка", "type": "Лесопилка"},
-            {"image": self.voenka_image, "pos": (start_x, start_y + button_size + 80), "text": "Военный завод", "type": "Военный завод"},
-            {"image": self.rydnik_glezo_image, "pos": (start_x + button_size + button_margin, start_y + button_size + 80), "text": "Железная шахта", "type": "Железная шахта"},
-            {"image": self.rydnik_kamini_image, "pos": (start_x + (button_size + button_margin) * 2, start_y + button_size + 80), "text": "Каменная шахта", "type": "Каменная шахта"},
-            {"image": self.rydnik_midi_image, "pos": (start_x + (button_size + button_margin) * 3, start_y + button_size + 80), "text": "Медная шахта", "type": "Медная шахта"}
-        ]
+        button_size = MENU_BUTTON_SIZE
+        # Что по карману, пересчитывается только после изменения запасов
+        affordable = self.world.affordable_buildings()
 
-        for button in buttons:
-            can_afford = self.can_afford_building(button["type"])
+        for button in self.menu_buttons:
+            can_afford = button["kind"] in affordable
             border_color = (0, 255, 0) if can_afford else (255, 0, 0)
             
-            mouse_pos = pygame.mouse.get_pos()
-            button_rect = pygame.Rect(button["pos"][0] - 5, button["pos"][1] - 5, button_size + 10, button_size + 10)
+            if button["type"] == self.hovered_building:
+                pygame.draw.rect(self.screen, YELLOW, button["hover"], 4)
             
-            if button_rect.collidepoint(mouse_pos):
-                hover_rect = pygame.Rect(button["pos"][0] - 8, button["pos"][1] - 8, button_size + 16, button_size + 16)
-                pygame.draw.rect(self.screen, YELLOW, hover_rect, 4)
-            
-            pygame.draw.rect(self.screen, border_color, button_rect, 2)
-            self.screen.blit(button["image"], button["pos"])
+            pygame.draw.rect(self.screen, border_color, button["frame"], 2)
+            self.screen.blit(self.building_images[button["type"]], button["pos"])
 
-            text_font = pygame.font.Font(None, self.font_size_small)
-            text = text_font.render(button["text"], True, WHITE)
+            text = self.text_cache.render(button["type"], self.font_size_small, WHITE)
             text_x = button["pos"][0] + button_size // 2 - text.get_width() // 2
             text_y = button["pos"][1] + button_size + 10
             self.screen.blit(text, (text_x, text_y))
 
-            cost_font = pygame.font.Font(None, self.font_size_small - 2)
             if button["type"] in self.building_costs:
                 cost_lines = []
                 for res, amount in self.building_costs[button["type"]].items():
                     cost_lines.append(f"{res}: {amount}")
                 
                 for i, cost_line in enumerate(cost_lines):
-                    cost_surface = cost_font.render(cost_line, True, YELLOW if can_afford else RED)
+                    cost_surface = self.text_cache.render(cost_line, self.font_size_small - 2, YELLOW if can_afford else RED)
                     cost_x = button["pos"][0] + button_size // 2 - cost_surface.get_width() // 2
                     cost_y = button["pos"][1] + button_size + 25 + i * 12
                     self.screen.blit(cost_surface, (cost_x, cost_y))
@@ -778,74 +1580,69 @@ class Game:
             pygame.draw.rect(self.screen, DARK_BLUE, info_rect)
             pygame.draw.rect(self.screen, WHITE, info_rect, 2)
             
-            info_font = pygame.font.Font(None, self.font_size_medium)
-            info_text = info_font.render(f"Информация о: {self.hovered_building}", True, YELLOW)
+            info_text = self.text_cache.render(f"Информация о: {self.hovered_building}", self.font_size_medium, YELLOW)
             self.screen.blit(info_text, (info_rect.x + 10, info_rect.y + 10))
             
             production_info = self.get_building_production(self.hovered_building)
-            prod_text = info_font.render(f"Производство: {production_info}", True, WHITE)
+            prod_text = self.text_cache.render(f"Производство: {production_info}", self.font_size_medium, WHITE)
             self.screen.blit(prod_text, (info_rect.x + 10, info_rect.y + 40))
             
             placement_info = self.get_building_placement_info(self.hovered_building)
-            place_text = info_font.render(f"Размещение: {placement_info}", True, WHITE)
+            place_text = self.text_cache.render(f"Размещение: {placement_info}", self.font_size_medium, WHITE)
             self.screen.blit(place_text, (info_rect.x + 10, info_rect.y + 70))
 
-        close_rect = pygame.Rect(self.mol_menu_rect.right - 30, self.mol_menu_rect.y + 10, 20, 20)
+        close_rect = self.close_button_rect
         pygame.draw.rect(self.screen, RED, close_rect)
         pygame.draw.rect(self.screen, WHITE, close_rect, 2)
-        close_font = pygame.font.Font(None, self.font_size_medium)
-        close_text = close_font.render("X", True, WHITE)
+        close_text = self.text_cache.render("X", self.font_size_medium, WHITE)
         self.screen.blit(close_text, (close_rect.x + 6, close_rect.y + 2))
 
-        hint_font = pygame.font.Font(None, self.font_size_medium)
         hint_text = "Зеленый = можно построить, Красный = не хватает ресурсов"
-        hint_surface = hint_font.render(hint_text, True, YELLOW)
+        hint_surface = self.text_cache.render(hint_text, self.font_size_medium, YELLOW)
         self.screen.blit(hint_surface, (self.mol_menu_rect.centerx - hint_surface.get_width() // 2, 
                                        self.mol_menu_rect.bottom - 30))
 
+    def build_menu_buttons(self):
+        """Кнопки меню построек в порядке BUILD_MENU_ORDER: область нажатия, рамки и тип здания"""
+        start_x = self.mol_menu_rect.x + 50
+        start_y = self.mol_menu_rect.y + 80
+        buttons = []
+        for i, building_type in enumerate(BUILD_MENU_ORDER):
+            row, column = divmod(i, MENU_COLUMNS)
+            x = start_x + (MENU_BUTTON_SIZE + MENU_BUTTON_MARGIN) * column
+            y = start_y + (MENU_BUTTON_SIZE + 80) * row
+            buttons.append({
+                "rect": pygame.Rect(x, y, MENU_BUTTON_SIZE, MENU_BUTTON_SIZE),
+                "frame": pygame.Rect(x - 5, y - 5, MENU_BUTTON_SIZE + 10, MENU_BUTTON_SIZE + 10),
+                "hover": pygame.Rect(x - 8, y - 8, MENU_BUTTON_SIZE + 16, MENU_BUTTON_SIZE + 16),
+                "pos": (x, y),
+                "type": building_type,
+                "kind": BUILDING_IDS[building_type]
+            })
+        return buttons
+
     def get_building_placement_info(self, building_type):
         """Возвращает информацию о требованиях к размещению здания"""
-        placement = {
-            "Лесопилка": "Только на лесе",
-            "Завод": "На пустой клетке", 
-            "Нефтяная вышка": "Только на нефти",
-            "Лаборатория": "На пустой клетке",
-            "Железная шахта": "Только на железе",
-            "Каменная шахта": "Только на камне",
-            "Медная шахта": "Только на меди",
-            "Военный завод": "На пустой клетке"
-        }
-        return placement.get(building_type, "Неизвестно")
+        if building_type not in BUILDING_PLACEMENT:
+            return "Неизвестно"
+        return BUILDING_PLACEMENT[building_type] or "На пустой клетке"
 
     def draw_settings_menu(self):
         """Отрисовка меню настроек"""
-        self.draw_main_menu()
-
-        overlay = pygame.Surface((self.screen_width, self.screen_height), pygame.SRCALPHA)
-        overlay.fill((0, 0, 0, 128))
-        self.screen.blit(overlay, (0, 0))
+        self.draw_menu_background(self.draw_main_menu)
 
         pygame.draw.rect(self.screen, DARK_BLUE, self.mol_menu_rect)
         pygame.draw.rect(self.screen, WHITE, self.mol_menu_rect, 2)
 
-        font = pygame.font.Font(None, self.font_size_title)
-        title = font.render("Настройки", True, WHITE)
+        title = self.text_cache.render("Настройки", self.font_size_title, WHITE)
         self.screen.blit(title, (self.mol_menu_rect.centerx - title.get_width() // 2,
                                  self.mol_menu_rect.y + 20))
 
-        sub_font = pygame.font.Font(None, self.font_size_large)
-        sub_title = sub_font.render("Выберите разрешение экрана:", True, WHITE)
+        sub_title = self.text_cache.render("Выберите разрешение экрана:", self.font_size_large, WHITE)
         self.screen.blit(sub_title, (self.mol_menu_rect.centerx - sub_title.get_width() // 2,
                                      self.mol_menu_rect.y + 40))
 
-        for i, resolution in enumerate(RESOLUTIONS):
-            button_rect = pygame.Rect(
-                self.mol_menu_rect.x + 50,
-                self.mol_menu_rect.y + 60 + i * 60,
-                self.mol_menu_rect.width - 100,
-                50
-            )
-
+        for i, (resolution, button_rect) in enumerate(zip(RESOLUTIONS, self.resolution_buttons)):
             if i == self.current_resolution:
                 pygame.draw.rect(self.screen, ORANGE, button_rect)
             else:
@@ -858,34 +1655,242 @@ class Game:
             else:
                 res_text = f"{resolution[0]} x {resolution[1]}"
             
-            text_surface = font.render(res_text, True, WHITE)
+            text_surface = self.text_cache.render(res_text, self.font_size_title, WHITE)
             self.screen.blit(text_surface, (button_rect.centerx - text_surface.get_width() // 2,
                                            button_rect.centery - text_surface.get_height() // 2))
 
-        close_rect = pygame.Rect(self.mol_menu_rect.right - 30, self.mol_menu_rect.y + 10, 20, 20)
+        close_rect = self.close_button_rect
         pygame.draw.rect(self.screen, RED, close_rect)
         pygame.draw.rect(self.screen, WHITE, close_rect, 2)
-        close_font = pygame.font.Font(None, self.font_size_medium)
-        close_text = close_font.render("X", True, WHITE)
+        close_text = self.text_cache.render("X", self.font_size_medium, WHITE)
         self.screen.blit(close_text, (close_rect.x + 6, close_rect.y + 2))
 
-    def run(self):
-        running = True
-        while running:
-            running = self.handle_events()
-
-            if self.state == MAIN_MENU:
-                self.draw_main_menu()
-            elif self.state == GAME_SCREEN:
-                self.draw_game_screen()
-            elif self.state == MOL_MENU:
-                self.draw_mol_menu()
-            elif self.state == SETTINGS_MENU:
-                self.draw_settings_menu()
+    def toggle_profiler(self):
+        """Включение и выключение замеров кадра с оверлеем"""
+        self.profiler.toggle(self, PROFILED_METHODS)
+        self.profile_overlay = None
+        self.mark_dirty()
+
+    def dump_profile(self, path=None):
+        """Выгрузка последних кадров профайлера в CSV (или JSON по расширению)"""
+        if not self.profiler.frames:
+            log.info("Нет данных профайлера - включите его клавишей F3")
+            return None
+        path = path or os.path.join(self.save_dir, time.strftime("profile-%Y%m%d-%H%M%S.csv"))
+        try:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.profiler.dump(path)
+        except OSError as e:
+            log.error("Не удалось сохранить замеры в %s: %s", path, e)
+            return None
+        log.info("Замеры кадров сохранены: %s", path)
+        return path
+
+    def profile_counters(self):
+        """Количество сущностей и попадания в кэши - для профайлера"""
+        text_total = self.text_cache.hits + self.text_cache.misses
+        counters = {
+            "buildings": len(self.world.buildings),
+            "units": len(self.world.units),
+            "tiles": len(self.world.tiles),
+            "terrain_chunks": len(self.terrain_chunks),
+            "terrain_chunk_mb": self.terrain_chunk_pixels * self.screen.get_bytesize() / (1024 * 1024),
+            "text_cache_hit_rate": self.text_cache.hits / text_total if text_total else 0.0,
+        }
+        disk_cache = self.assets.disk_cache
+        if disk_cache:
+            image_total = disk_cache.hits + disk_cache.misses
+            counters["image_cache_hit_rate"] = disk_cache.hits / image_total if image_total else 0.0
+        return counters
+
+    def draw_profiler_overlay(self):
+        """Оверлей профайлера; текст обновляется несколько раз в секунду, а не каждый кадр"""
+        now = time.perf_counter()
+        if self.profile_overlay is None or now - self.profile_overlay_time >= PROFILE_OVERLAY_INTERVAL:
+            self.profile_overlay_time = now
+            stats = self.profiler.stats()
+            lines = [f"FPS: {self.profiler.fps():.1f}"]
+            for name in ["frame_ms"] + PROFILED_METHODS:
+                if name in stats:
+                    average, peak = stats[name]
+                    lines.append(f"{name}: {average:.2f} / {peak:.2f} мс")
+            for name in ("alloc_blocks", "gc_collections", "buildings", "units", "tiles",
+                         "terrain_chunks", "terrain_chunk_mb", "text_cache_hit_rate", "image_cache_hit_rate"):
+                if name in stats:
+                    lines.append(f"{name}: {stats[name][0]:.2f}")
+
+            # Текст меняется постоянно, поэтому не кладется в кэш текста
+            font = self.text_cache.get_font(self.font_size_small)
+            line_height = font.get_linesize()
+            width = max(font.size(line)[0] for line in lines) + 20
+            self.profile_overlay = pygame.Surface((width, line_height * len(lines) + 20))
+            self.profile_overlay.fill(BLACK)
+            self.profile_overlay.set_alpha(200)
+            for i, line in enumerate(lines):
+                self.profile_overlay.blit(font.render(line, True, YELLOW), (10, 10 + i * line_height))
+
+        self.screen.blit(self.profile_overlay, self.profile_overlay_rect())
+
+    def profile_overlay_rect(self):
+        if self.profile_overlay is None:
+            return None
+        return self.profile_overlay.get_rect(topleft=(20, 20 + self.font_size_large * 2))
+
+    def draw_menu_background(self, draw_background):
+        """Затемненный экран под меню: рисуется один раз, потом берется из снимка"""
+        if self.menu_background is None or self.menu_background_key != draw_background:
+            # Снимок нужен целиком, даже если сейчас рисуется только часть экрана
+            clip = self.screen.get_clip()
+            self.screen.set_clip(None)
+            draw_background()
+            self.screen.blit(self.dim_overlay, (0, 0))
+            self.menu_background = self.screen.copy()
+            self.menu_background_key = draw_background
+            self.screen.set_clip(clip)
+        else:
+            self.screen.blit(self.menu_background, (0, 0))
 
+    def mark_dirty(self, rect=None):
+        """Пометить область для перерисовки (без аргумента - весь экран)"""
+        if rect is None:
+            self.full_redraw = True
+        else:
+            self.dirty_rects.append(pygame.Rect(rect))
+
+    def get_preview_rect(self):
+        """Клетка под курсором, где рисуется призрак выбранного здания"""
+        if self.state != GAME_SCREEN or not self.selected_building:
+            return None
+        cell = self.screen_to_cell(pygame.mouse.get_pos())
+        return pygame.Rect(self.cell_to_screen(cell), (self.tile_size, self.tile_size))
+
+    def draw_state(self):
+        """Отрисовка текущего состояния игры"""
+        if self.state not in (MOL_MENU, SETTINGS_MENU):
+            # Экран под меню мог измениться - снимок сделается заново
+            self.menu_background = None
+
+        if self.state == MAIN_MENU:
+            self.draw_main_menu()
+        elif self.state == GAME_SCREEN:
+            self.draw_game_screen()
+        elif self.state == MOL_MENU:
+            self.draw_mol_menu()
+        elif self.state == SETTINGS_MENU:
+            self.draw_settings_menu()
+
+        if self.assets.is_loading():
+            self.draw_loading_bar()
+
+        if self.profiler.enabled:
+            self.draw_profiler_overlay()
+
+    def flip(self, rects=None):
+        """Вывод кадра на экран: целиком или только области rects"""
+        if rects is None:
             pygame.display.flip()
-            self.clock.tick(60)
+        else:
+            pygame.display.update(rects)
+
+    def draw_dirty(self):
+        """Перерисовка только измененных областей, пустые кадры пропускаются"""
+        if self.state != self.drawn_state:
+            self.drawn_state = self.state
+            self.full_redraw = True
+
+        preview_rect = self.get_preview_rect()
+        if preview_rect != self.last_preview_rect:
+            for rect in (self.last_preview_rect, preview_rect):
+                if rect:
+                    self.mark_dirty(rect)
+            self.last_preview_rect = preview_rect
+
+        if self.profiler.enabled and self.profile_overlay is not None:
+            self.mark_dirty(self.profile_overlay_rect())
+
+        if self.full_redraw:
+            self.draw_state()
+            self.flip()
+        elif self.dirty_rects:
+            # Рисуем только внутри измененной области
+            self.screen.set_clip(self.dirty_rects[0].unionall(self.dirty_rects[1:]))
+            self.draw_state()
+            self.screen.set_clip(None)
+            self.flip(self.dirty_rects)
+
+        self.full_redraw = False
+        self.dirty_rects = []
+
+    def is_paused(self):
+        """Окно свернуто или не в фокусе - кадры не рисуются"""
+        if self.headless:
+            return False
+        return not self.window_focused or not pygame.display.get_active()
+
+    def is_animating(self):
+        """Нужны ли кадры без событий: загрузка, ход противников, прокрутка клавишами, оверлей профайлера"""
+        if self.assets.is_loading() or self.profiler.enabled:
+            return True
+        if self.ai and self.ai.thinking():
+            return True
+        if self.state == GAME_SCREEN:
+            dx, dy = self.camera_direction()
+            return bool(dx or dy)
+        return False
+
+    def wait_events(self):
+        """События кадра. Если ничего не движется, ждем их, не нагружая процессор."""
+        paused = self.is_paused()
+        # Картинки догружаются и без фокуса
+        if self.assets.is_loading():
+            return pygame.event.get()
+        if not paused and (self.is_animating() or self.full_redraw or self.dirty_rects):
+            return pygame.event.get()
+        timeout = PAUSED_WAIT_MS if paused else IDLE_WAIT_MS
+
+        event = pygame.event.wait(timeout)
+        if event.type == pygame.NOEVENT:
+            return []
+        return [event] + pygame.event.get()
 
+    def run(self):
+        running = True
+        while running:
+            profiling = self.profiler.enabled
+            if profiling:
+                self.profiler.begin_frame()
+
+            events = self.wait_events()
+            running = self.handle_events(events)
+
+            if self.assets.is_loading():
+                self.update_loading()
+            if self.state == GAME_SCREEN:
+                self.update_camera()
+            if self.ai:
+                self.update_ai()
+
+            # Кадр рисуется, только если что-то произошло или меняется само
+            if not self.is_paused() and (events or self.is_animating() or self.full_redraw or self.dirty_rects):
+                if self.dirty_rendering:
+                    self.draw_dirty()
+                else:
+                    self.draw_state()
+                    self.flip()
+                    self.full_redraw = False
+                    self.dirty_rects = []
+            if profiling:
+                self.profiler.end_frame(self.profile_counters())
+
+            # После ожидания событий tick не задерживает, а в анимации держит ограничение FPS
+            self.clock.tick(self.fps_cap)
+
+        if self.autosaver:
+            self.autosaver.close()
+        if self.ai:
+            self.ai.close()
+        if self.replay_log:
+            self.replay_log.close(self.world)
         pygame.quit()
         sys.exit()
 
@@ -929,6 +1934,9 @@ def create_exe_and_run():
         # Добавляем папку с изображениями если существует
         if os.path.exists("images"):
             cmd.extend(["--add-data", f"images{os.pathsep}images"])
+
+        # Описания зданий, юнитов и ресурсов
+        cmd.extend(["--add-data", f"rules.json{os.pathsep}."])
         
         print("Запуск PyInstaller...")
         result = subprocess.run(cmd, check=True, timeout=300, 
@@ -972,6 +1980,7 @@ def main():
     print("=" * 50)
     print("VEKTOR - СТРАТЕГИЧЕСКАЯ ИГРА")
     print("=" * 50)
+    setup_logging(os.path.join(get_save_dir(), "logs"))
     
     # Проверка безопасности
     if not verify_environment():
@@ -1016,4 +2025,6 @@ def main():
             input("Нажмите Enter для выхода...")
 
 if __name__  == "__main__":
+     # Процессы противников в собранном EXE запускаются той же программой
+     multiprocessing.freeze_support()
      main()
\ No newline at end of file
@@ -0,0 +1,108 @@
+"""Журнал событий игры: запись в файл и на консоль в фоновом потоке.
+
+Модули берут логгер через get_logger() и пишут события обычными
+вызовами logging с полями event и data (extra). Запись в очередь
+не ждет ни диска, ни консоли - их обслуживает отдельный поток
+QueueListener. Пока setup_logging() не вызван (бенчмарк, повтор
+журнала, процессы противников), события никуда не пишутся.
+
+В файл события идут строками JSON:
+    {"time": ..., "level": ..., "logger": ..., "event": ..., "message": ..., поля data}
+Файл переходит в резервные копии при достижении LOG_MAX_BYTES.
+"""
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+
+ROOT_LOGGER = "vektor"
+LOG_FILE = "vektor.log"
+
+# Размер файла журнала до перехода в копию и сколько копий хранить
+LOG_MAX_BYTES = 1024 * 1024
+LOG_BACKUPS = 5
+
+logging.getLogger(ROOT_LOGGER).addHandler(logging.NullHandler())
+
+_listener = None
+_queue_handler = None
+
+def get_logger(name):
+    """Логгер модуля игры"""
+    return logging.getLogger(f"{ROOT_LOGGER}.{name}")
+
+class JsonFormatter(logging.Formatter):
+    """Событие одной строкой JSON"""
+
+    def format(self, record):
+        entry = {
+            "time": self.formatTime(record, "%Y-%m-%dT%H:%M:%S"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": getattr(record, "event", None),
+            "message": record.getMessage(),
+        }
+        entry.update(getattr(record, "data", None) or {})
+        return json.dumps(entry, ensure_ascii=False, default=str)
+
+def setup_logging(directory=None, level=None, console=True, filename=LOG_FILE):
+    """Запуск фоновой записи журнала; повторный вызов ничего не делает.
+
+    directory - папка файла журнала (None - без файла), level - уровень
+    (по умолчанию из VEKTOR_LOG_LEVEL или INFO; неизвестный - INFO
+    с предупреждением). Консоль пропускается, если ее нет (EXE без
+    окна консоли).
+    """
+    global _listener, _queue_handler
+    if _listener is not None:
+        return
+
+    handlers = []
+    if directory:
+        try:
+            os.makedirs(directory, exist_ok=True)
+            file_handler = logging.handlers.RotatingFileHandler(
+                os.path.join(directory, filename), maxBytes=LOG_MAX_BYTES,
+                backupCount=LOG_BACKUPS, encoding="utf-8"
+            )
+        except OSError as e:
+            print(f"Не удалось открыть журнал в {directory}: {e}")
+        else:
+            file_handler.setFormatter(JsonFormatter())
+            handlers.append(file_handler)
+    if console and sys.stderr is not None:
+        console_handler = logging.StreamHandler(sys.stderr)
+        console_handler.setFormatter(logging.Formatter("%(message)s"))
+        handlers.append(console_handler)
+    if not handlers:
+        return
+
+    level = level or os.environ.get("VEKTOR_LOG_LEVEL", "INFO")
+    if isinstance(level, int) or level.isdigit():
+        number = int(level)
+    else:
+        number = logging.getLevelName(level.upper())
+    log_queue = queue.SimpleQueue()
+    logger = logging.getLogger(ROOT_LOGGER)
+    logger.setLevel(number if isinstance(number, int) else logging.INFO)
+    _queue_handler = logging.handlers.QueueHandler(log_queue)
+    logger.addHandler(_queue_handler)
+    _listener = logging.handlers.QueueListener(log_queue, *handlers)
+    _listener.start()
+    atexit.register(stop_logging)
+    if not isinstance(number, int):
+        logger.warning("Неизвестный уровень журнала %r - используется INFO", level)
+
+def stop_logging():
+    """Дописывает очередь и останавливает фоновый поток"""
+    global _listener, _queue_handler
+    if _listener is None:
+        return
+    logging.getLogger(ROOT_LOGGER).removeHandler(_queue_handler)
+    _listener.stop()
+    for handler in _listener.handlers:
+        handler.close()
+    _listener = _queue_handler = None
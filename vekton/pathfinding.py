@@ -0,0 +1,367 @@
+"""Поиск пути юнитов по сетке клеток.
+
+Здания непроходимы, клетки с ресурсами и юниты - проходимы. Юнит
+шагает в первую (по NEIGHBORS) соседнюю клетку с расстоянием до цели
+на 1 меньше. Группа от FLOW_FIELD_GROUP юнитов с одной целью делит
+поле направлений (flow field): расстояния до цели от каждой клетки
+квадрата радиуса R вокруг нее. Расстояние не больше R в квадрате
+совпадает с расстоянием по всей карте; дальше R - поле большего
+радиуса, за последним - поле на всю карту. Меньшие группы идут по
+пути A*, выбранному по тому же правилу, и по сохраненному для цели
+пути, пока стоят на нем. Поэтому шаг не зависит от того, какие поля
+и пути уже в кэше (например, после загрузки).
+
+Новое здание пересчитывает в полях только расстояния, которые шли
+через его клетку, и сбрасывает только пути, проходящие через нее.
+"""
+import heapq
+from array import array
+from collections import OrderedDict, deque
+
+# Соседи клетки, порядок задает выбор среди равных путей
+NEIGHBORS = ((1, 0), (0, 1), (-1, 0), (0, -1))
+
+# Радиусы полей направлений - квадратов со стороной 2 * радиус + 1 вокруг цели
+FLOW_FIELD_RADII = (32, 160)
+MAX_FLOW_FIELDS = 32
+# С какого числа юнитов, идущих к одной цели, строить для них поле направлений
+FLOW_FIELD_GROUP = 8
+
+# Кэш путей A* и ограничение на число раскрытых клеток одного поиска
+MAX_PATHS = 4096
+MAX_SEARCH_NODES = 50000
+
+# Как далеко от здания искать свободную клетку для нового юнита
+SPAWN_RADIUS = 8
+
+def passable(world, cell):
+    return world.in_bounds(cell) and world.index.building_at(cell) is None
+
+def nearest_free_cell(world, cell, max_distance=SPAWN_RADIUS):
+    """Ближайшая по пути клетка без зданий и юнитов или None.
+
+    Поиск в ширину от cell (сама она может быть занята, например зданием).
+    """
+    index = world.index
+    seen = {cell}
+    queue = deque([(cell, 0)])
+    while queue:
+        (x, y), distance = queue.popleft()
+        if distance >= max_distance:
+            continue
+        for dx, dy in NEIGHBORS:
+            neighbor = (x + dx, y + dy)
+            if neighbor in seen or not passable(world, neighbor):
+                continue
+            if not index.units_at(neighbor):
+                return neighbor
+            seen.add(neighbor)
+            queue.append((neighbor, distance + 1))
+    return None
+
+class FlowField:
+    """Расстояния до цели (-1 - недостижимо) в квадрате вокруг нее"""
+
+    def __init__(self, world, goal, radius):
+        self.goal = goal
+        self.radius = radius
+        self.left = max(0, goal[0] - radius)
+        self.top = max(0, goal[1] - radius)
+        self.right = min(world.width, goal[0] + radius + 1)
+        self.bottom = min(world.height, goal[1] + radius + 1)
+        self.width = self.right - self.left
+        self.distances = array("i", [-1]) * (self.width * (self.bottom - self.top))
+        if self.covers(goal) and passable(world, goal):
+            self.compute(world)
+
+    def covers(self, cell):
+        return self.left <= cell[0] < self.right and self.top <= cell[1] < self.bottom
+
+    def distance(self, cell):
+        return self.distances[(cell[1] - self.top) * self.width + cell[0] - self.left]
+
+    def compute(self, world):
+        """Поиск в ширину от цели по проходимым клеткам квадрата"""
+        buildings = world.index.buildings
+        distances = self.distances
+        width, left, top = self.width, self.left, self.top
+        right, bottom = self.right, self.bottom
+        distances[(self.goal[1] - top) * width + self.goal[0] - left] = 0
+        queue = deque([self.goal])
+        while queue:
+            x, y = queue.popleft()
+            next_distance = distances[(y - top) * width + x - left] + 1
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if not (left <= nx < right and top <= ny < bottom):
+                    continue
+                i = (ny - top) * width + nx - left
+                if distances[i] >= 0 or (nx, ny) in buildings:
+                    continue
+                distances[i] = next_distance
+                queue.append((nx, ny))
+
+    def block(self, cell):
+        """Клетка стала непроходимой: пересчет расстояний только там, где путь шел через нее.
+
+        Сначала находятся клетки, у которых не осталось соседа с расстоянием
+        на 1 меньше (по слоям от cell), потом им заново раздаются расстояния
+        от границы этой области. Результат - как у нового поиска в ширину.
+        """
+        if not self.covers(cell) or self.distance(cell) < 0:
+            return
+        distances = self.distances
+        width, left, top = self.width, self.left, self.top
+        right, bottom = self.right, self.bottom
+
+        def neighbors(x, y):
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                if left <= nx < right and top <= ny < bottom:
+                    yield nx, ny, (ny - top) * width + nx - left
+
+        i = (cell[1] - top) * width + cell[0] - left
+        blocked_distance = distances[i]
+        distances[i] = -1
+        # Клетки, потерявшие опору
+        lost = set()
+        queue = deque((nx, ny) for nx, ny, j in neighbors(*cell) if distances[j] == blocked_distance + 1)
+        while queue:
+            x, y = queue.popleft()
+            if (x, y) in lost:
+                continue
+            distance = distances[(y - top) * width + x - left]
+            if any(distances[j] == distance - 1 and (nx, ny) not in lost for nx, ny, j in neighbors(x, y)):
+                continue
+            lost.add((x, y))
+            queue.extend((nx, ny) for nx, ny, j in neighbors(x, y) if distances[j] == distance + 1)
+
+        for x, y in lost:
+            distances[(y - top) * width + x - left] = -1
+        heap = []
+        for x, y in lost:
+            known = [distances[j] for _, _, j in neighbors(x, y) if distances[j] >= 0]
+            if known:
+                heap.append((min(known) + 1, x, y))
+        heapq.heapify(heap)
+        while heap:
+            distance, x, y = heapq.heappop(heap)
+            i = (y - top) * width + x - left
+            if distances[i] >= 0:
+                continue
+            distances[i] = distance
+            for nx, ny, j in neighbors(x, y):
+                if distances[j] < 0 and (nx, ny) in lost:
+                    heapq.heappush(heap, (distance + 1, nx, ny))
+
+    def walk(self, start, steps):
+        """До steps клеток от start к цели; None, если путь длиннее радиуса или его нет"""
+        if not self.covers(start):
+            return None
+        distance = self.distance(start)
+        if not 0 <= distance <= self.radius:
+            return None
+        cells = []
+        x, y = start
+        while distance > 0 and len(cells) < steps:
+            for dx, dy in NEIGHBORS:
+                neighbor = (x + dx, y + dy)
+                if self.covers(neighbor) and self.distance(neighbor) == distance - 1:
+                    x, y = neighbor
+                    break
+            distance -= 1
+            cells.append((x, y))
+        return cells
+
+class PathFinder:
+    """Пути юнитов партии с кэшем полей направлений и путей A*"""
+
+    def __init__(self, world):
+        self.world = world
+        self.fields = OrderedDict()
+        self.paths = OrderedDict()
+        # Клетка -> {ключ пути (старт, цель): номер клетки в этом пути}
+        self.through = {}
+        self.known_buildings = 0
+
+    def clear(self):
+        self.fields.clear()
+        self.paths.clear()
+        self.through.clear()
+        self.known_buildings = 0
+
+    def sync(self):
+        """Сброс кэша там, где появились новые здания (список зданий только растет)"""
+        buildings = self.world.buildings
+        if len(buildings) < self.known_buildings:
+            self.clear()
+        for building in buildings[self.known_buildings:]:
+            self.invalidate((building.x, building.y))
+        self.known_buildings = len(buildings)
+
+    def invalidate(self, cell):
+        """Клетка стала непроходимой"""
+        for key, field in list(self.fields.items()):
+            if field.goal == cell:
+                del self.fields[key]
+            else:
+                field.block(cell)
+        for key in self.through.pop(cell, ()):
+            self.drop_path(key)
+
+    def drop_path(self, key):
+        path = self.paths.pop(key, None)
+        if path is None:
+            return
+        for cell in path:
+            keys = self.through.get(cell)
+            if keys is not None:
+                keys.pop(key, None)
+                if not keys:
+                    del self.through[cell]
+
+    def flow_field(self, goal, radius):
+        key = (goal, radius)
+        field = self.fields.get(key)
+        if field is None:
+            field = FlowField(self.world, goal, radius)
+            self.fields[key] = field
+            if len(self.fields) > MAX_FLOW_FIELDS:
+                self.fields.popitem(last=False)
+        else:
+            self.fields.move_to_end(key)
+        return field
+
+    def find_path(self, start, goal, steps=None):
+        """До steps клеток пути от start до goal (без start; все - без steps) или None.
+
+        Сначала ищется сохраненный путь к той же цели, на котором уже
+        стоит start (юнит идет по своему пути) - от него берется хвост.
+        """
+        for key, position in self.through.get(start, {}).items():
+            if key[1] == goal:
+                self.paths.move_to_end(key)
+                end = None if steps is None else position + 1 + steps
+                return self.paths[key][position + 1:end]
+
+        path = self.search(start, goal)
+        if path is None:
+            return None
+        key = (start, goal)
+        path.insert(0, start)
+        self.paths[key] = path
+        for position, cell in enumerate(path):
+            self.through.setdefault(cell, {})[key] = position
+        if len(self.paths) > MAX_PATHS:
+            self.drop_path(next(iter(self.paths)))
+        return path[1:] if steps is None else path[1:steps + 1]
+
+    def search(self, start, goal):
+        """Путь от start до goal (без start) по тому же правилу, что и у поля направлений.
+
+        A* идет от цели к start и дает расстояния до цели, а путь
+        строится от start: шаг - в первую (по NEIGHBORS) соседнюю клетку
+        с расстоянием на 1 меньше. Поэтому хвост пути от любой его клетки -
+        это путь от нее самой, откуда бы ни искали. Расстояния соседей,
+        которые поиск еще не знает, он досчитывает.
+        """
+        if not passable(self.world, goal):
+            return None
+        buildings = self.world.index.buildings
+        width, height = self.world.width, self.world.height
+        start_x, start_y = start
+        goal_x, goal_y = goal
+        # Лучшее известное расстояние до цели; у закрытых клеток - точное
+        cost = {goal: 0}
+        closed = set()
+        counter = 0
+        heap = [(abs(goal_x - start_x) + abs(goal_y - start_y), 0, counter, goal)]
+        # Путь от start в открытом поле идет сначала по первому (по NEIGHBORS)
+        # направлению к цели, потом по второму. Поиск от цели при равенстве
+        # раскрывает сначала клетки в обратном порядке - тогда он сразу
+        # проходит по этому пути, а не по всему прямоугольнику между клетками.
+        toward = [
+            (dx, dy) for dx, dy in NEIGHBORS
+            if abs(start_x + dx - goal_x) + abs(start_y + dy - goal_y) < abs(start_x - goal_x) + abs(start_y - goal_y)
+        ]
+        order = [(-dx, -dy) for dx, dy in reversed(toward)]
+        order += [direction for direction in NEIGHBORS if direction not in order]
+
+        def expand(done):
+            """Раскрывает клетки, пока не выполнено done(); False - поиск исчерпан"""
+            nonlocal counter
+            while not done():
+                if not heap or len(closed) > MAX_SEARCH_NODES:
+                    return False
+                _, _, _, cell = heapq.heappop(heap)
+                if cell in closed:
+                    continue
+                closed.add(cell)
+                x, y = cell
+                next_cost = cost[cell] + 1
+                for dx, dy in order:
+                    nx, ny = x + dx, y + dy
+                    neighbor = (nx, ny)
+                    if not (0 <= nx < width and 0 <= ny < height):
+                        continue
+                    # Здание могли поставить под самим юнитом - он из него выходит
+                    if neighbor in buildings and neighbor != start:
+                        continue
+                    if next_cost < cost.get(neighbor, next_cost + 1):
+                        cost[neighbor] = next_cost
+                        counter += 1
+                        # При равной оценке первой раскрывается клетка ближе к start
+                        estimate = next_cost + abs(nx - start_x) + abs(ny - start_y)
+                        heapq.heappush(heap, (estimate, -next_cost, counter, neighbor))
+            return True
+
+        if not expand(lambda: start in closed):
+            return None
+
+        path = []
+        x, y = start
+        distance = cost[start]
+        while distance > 0:
+            for dx, dy in NEIGHBORS:
+                nx, ny = x + dx, y + dy
+                neighbor = (nx, ny)
+                # Ближе, чем по прямой, не бывает; меньше distance - 1 тоже (сосед)
+                if abs(nx - goal_x) + abs(ny - goal_y) > distance - 1 or neighbor in buildings:
+                    continue
+                if not (0 <= nx < width and 0 <= ny < height):
+                    continue
+                if cost.get(neighbor) != distance - 1:
+                    # Расстояние distance - 1 у соседа может быть, только пока
+                    # в куче есть клетки с оценкой не больше такой
+                    bound = distance - 1 + abs(nx - start_x) + abs(ny - start_y)
+                    if not expand(lambda: neighbor in closed or not heap or heap[0][0] > bound):
+                        return None
+                if cost.get(neighbor) == distance - 1:
+                    x, y = neighbor
+                    break
+            else:
+                return None
+            distance -= 1
+            path.append((x, y))
+        return path
+
+    def next_cells(self, start, goal, steps, group=1):
+        """До steps следующих клеток от start к goal ([] - уже на месте, None - не дойти).
+
+        group - сколько юнитов идет к этой цели: поле направлений строится
+        только для группы от FLOW_FIELD_GROUP, остальные идут по пути A*.
+        """
+        if start == goal:
+            return []
+        if not passable(self.world, goal):
+            return None
+        if group < FLOW_FIELD_GROUP:
+            return self.find_path(start, goal, steps)
+        # Путь не короче манхэттенского расстояния - меньшие поля не помогут
+        manhattan = abs(start[0] - goal[0]) + abs(start[1] - goal[1])
+        for radius in FLOW_FIELD_RADII:
+            if manhattan <= radius:
+                cells = self.flow_field(goal, radius).walk(start, steps)
+                if cells is not None:
+                    return cells
+        return self.flow_field(goal, self.world.width + self.world.height).walk(start, steps)
@@ -0,0 +1,129 @@
+"""Замеры времени кадра по участкам: для отладочного оверлея и выгрузки в файл.
+
+Пока замеры выключены, методы объекта не обернуты и работают как обычно,
+поэтому профайлер можно оставлять в готовой сборке. При включении
+методы подменяются на экземпляре обертками с замером времени.
+"""
+import csv
+import gc
+import json
+import sys
+import time
+from collections import deque
+
+# Сколько последних кадров хранить
+PROFILE_WINDOW = 300
+
+class Profiler:
+    """Время участков кадра (мс) и счетчики за последние window кадров"""
+
+    def __init__(self, window=PROFILE_WINDOW):
+        self.enabled = False
+        self.frames = deque(maxlen=window)
+        self.current = {}
+        self.frame_number = 0
+        self.frame_start = None
+        self.blocks_start = 0
+        self.gc_start = 0
+        self.attached = []
+
+    def wrap(self, name, func):
+        """Обертка над функцией, добавляющая ее время к участку name текущего кадра"""
+        perf_counter = time.perf_counter
+        current = self.current
+
+        def timed(*args, **kwargs):
+            start = perf_counter()
+            try:
+                return func(*args, **kwargs)
+            finally:
+                current[name] = current.get(name, 0.0) + (perf_counter() - start) * 1000
+
+        return timed
+
+    def enable(self, obj=None, names=()):
+        """Включение замеров; методы names объекта obj начинают замеряться"""
+        if self.enabled:
+            return
+        self.enabled = True
+        if obj is not None:
+            for name in names:
+                setattr(obj, name, self.wrap(name, getattr(obj, name)))
+                self.attached.append((obj, name))
+        self.frame_start = None
+
+    def disable(self):
+        """Выключение замеров: обертки снимаются, собранные кадры остаются"""
+        for obj, name in self.attached:
+            delattr(obj, name)
+        self.attached = []
+        self.enabled = False
+
+    def toggle(self, obj=None, names=()):
+        if self.enabled:
+            self.disable()
+        else:
+            self.enable(obj, names)
+        return self.enabled
+
+    def begin_frame(self):
+        self.current.clear()
+        self.frame_start = time.perf_counter()
+        self.blocks_start = sys.getallocatedblocks()
+        self.gc_start = gc.get_stats()[0]["collections"]
+
+    def end_frame(self, counters=None):
+        """Завершение кадра; counters - дополнительные значения (сущности, кэши)"""
+        if self.frame_start is None:
+            return
+        now = time.perf_counter()
+        frame = {
+            "frame": self.frame_number,
+            "time": now,
+            "frame_ms": (now - self.frame_start) * 1000,
+            # Прирост занятых блоков памяти и сборки мусора за кадр
+            "alloc_blocks": sys.getallocatedblocks() - self.blocks_start,
+            "gc_collections": gc.get_stats()[0]["collections"] - self.gc_start,
+        }
+        frame.update(self.current)
+        if counters:
+            frame.update(counters)
+        self.frames.append(frame)
+        self.frame_number += 1
+        self.frame_start = None
+
+    def fps(self):
+        if len(self.frames) < 2:
+            return 0.0
+        elapsed = self.frames[-1]["time"] - self.frames[0]["time"]
+        return (len(self.frames) - 1) / elapsed if elapsed > 0 else 0.0
+
+    def stats(self):
+        """{участок: (среднее, максимум)} за окно кадров"""
+        totals = {}
+        for frame in self.frames:
+            for key, value in frame.items():
+                if key in ("frame", "time"):
+                    continue
+                total, peak, count = totals.get(key, (0, value, 0))
+                totals[key] = (total + value, max(peak, value), count + 1)
+        return {key: (total / count, peak) for key, (total, peak, count) in totals.items()}
+
+    def columns(self):
+        keys = {}
+        for frame in self.frames:
+            keys.update(dict.fromkeys(frame))
+        return list(keys)
+
+    def dump(self, path):
+        """Выгрузка окна кадров в CSV или JSON (по расширению файла)"""
+        frames = list(self.frames)
+        if path.lower().endswith(".json"):
+            with open(path, "w", encoding="utf-8") as f:
+                json.dump({"fps": self.fps(), "frames": frames}, f, ensure_ascii=False, indent=2)
+        else:
+            with open(path, "w", encoding="utf-8", newline="") as f:
+                writer = csv.DictWriter(f, fieldnames=self.columns(), restval="")
+                writer.writeheader()
+                writer.writerows(frames)
+        return path
@@ -0,0 +1,266 @@
+"""Журнал команд партии и его повтор без окна.
+
+Журнал - заголовок, начальное состояние (в формате сохранения) и команды,
+которые только дописываются в конец. Партия меняется только командами,
+а ресурсы на карте создаются по seed из начального состояния, поэтому
+повтор журнала дает то же самое состояние.
+
+Запуск:
+    python replay.py replay.vkr --turn 120
+"""
+import argparse
+import hashlib
+import os
+import struct
+import sys
+import time
+
+from gamelog import get_logger
+from savegame import dump_game, parse_game
+
+log = get_logger("replay")
+
+MAGIC = b"VKRP"
+# Версия 2 - у команды есть номер фракции
+VERSION = 2
+HEADER = struct.Struct("<4sHI")
+COMMAND = struct.Struct("<BBiiQ")
+COMMAND_V1 = struct.Struct("<BiiQ")
+DIGEST_SIZE = 16
+
+# Команды журнала: (код, фракция, x, y, аргумент)
+BUILD = 1          # аргумент - тип здания
+RECRUIT = 2        # аргумент - тип юнита
+END_TURN = 3
+RESOLUTION = 4     # аргумент - номер разрешения, на партию не влияет
+# 5 - бывшая команда новой карты, код не используется
+STATE_HASH = 6     # после команды - хэш состояния партии
+MOVE = 7           # x, y - цель, аргумент - номер юнита
+ADD_FACTION = 8    # новая фракция с номером из поля фракции (игрок подключился к серверу)
+
+COMMAND_NAMES = {
+    BUILD: "постройка",
+    RECRUIT: "юнит",
+    END_TURN: "конец хода",
+    RESOLUTION: "разрешение",
+    STATE_HASH: "хэш",
+    MOVE: "приказ",
+    ADD_FACTION: "фракция",
+}
+
+# Снимки партии при повторе - каждые столько ходов
+SNAPSHOT_EVERY = 25
+# Сколько последних журналов хранить в папке
+MAX_LOGS = 20
+
+def state_hash(world):
+    """Хэш запасов, зданий, юнитов, номера хода и карты (seed)"""
+    return hashlib.blake2b(dump_game(world), digest_size=DIGEST_SIZE).digest()
+
+def apply_command(world, op, owner, x, y, arg):
+    """Выполняет команду журнала над партией; для постройки, найма и приказа - сущность или None"""
+    if op == BUILD:
+        return world.build((x, y), arg, owner)
+    elif op == RECRUIT:
+        return world.recruit((x, y), arg, owner)
+    elif op == MOVE:
+        return world.order_move(arg, (x, y), owner)
+    elif op == END_TURN:
+        world.end_turn()
+    elif op == ADD_FACTION:
+        if owner != len(world.factions):
+            raise ValueError(f"Фракция {owner} добавляется не по порядку")
+        world.add_faction(f"Игрок {owner + 1}")
+    return None
+
+def new_log_path(directory):
+    """Путь для нового журнала; старые журналы сверх MAX_LOGS удаляются"""
+    os.makedirs(directory, exist_ok=True)
+    logs = sorted(name for name in os.listdir(directory) if name.endswith(".vkr"))
+    for name in logs[:max(0, len(logs) - MAX_LOGS + 1)]:
+        try:
+            os.remove(os.path.join(directory, name))
+        except OSError:
+            pass
+
+    stamp = time.strftime("%Y%m%d-%H%M%S")
+    number = 0
+    while True:
+        path = os.path.join(directory, f"replay-{stamp}-{number}.vkr")
+        if not os.path.exists(path):
+            return path
+        number += 1
+
+class ReplayLog:
+    """Запись команд партии в журнал. Ошибки диска не мешают игре."""
+
+    def __init__(self, path, world):
+        self.path = path
+        self.commands = 0
+        initial = dump_game(world)
+        try:
+            self.file = open(path, "wb")
+            self.file.write(HEADER.pack(MAGIC, VERSION, len(initial)) + initial)
+        except OSError as e:
+            log.error("Не удалось начать журнал %s: %s", path, e)
+            self.file = None
+
+    def write(self, data):
+        if self.file is None:
+            return
+        try:
+            self.file.write(data)
+        except OSError as e:
+            log.error("Ошибка записи журнала %s: %s", self.path, e)
+            self.file = None
+
+    def record(self, op, x=0, y=0, arg=0, owner=0):
+        self.write(COMMAND.pack(op, owner, x, y, arg))
+        self.commands += 1
+
+    def flush(self):
+        if self.file is not None:
+            try:
+                self.file.flush()
+            except OSError as e:
+                log.error("Ошибка записи журнала %s: %s", self.path, e)
+                self.file = None
+
+    def close(self, world=None):
+        """Закрывает журнал; с world - дописывает хэш конечного состояния"""
+        if world is not None:
+            self.write(COMMAND.pack(STATE_HASH, 0, 0, 0, 0) + state_hash(world))
+        if self.file is not None:
+            try:
+                self.file.close()
+            except OSError:
+                pass
+            self.file = None
+
+def read_log(path):
+    """Начальное состояние (байты сохранения) и список команд (код, фракция, x, y, аргумент).
+
+    У команды STATE_HASH аргумент - ожидаемый хэш. Недописанный конец
+    файла (игра закрылась во время записи) пропускается.
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: слишком короткий файл")
+    magic, version, initial_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version not in (1, VERSION):
+        raise ValueError(f"{path}: неизвестный формат журнала")
+    command = COMMAND if version == VERSION else COMMAND_V1
+    offset = HEADER.size + initial_size
+    initial = data[HEADER.size:offset]
+
+    commands = []
+    while offset + command.size <= len(data):
+        if version == VERSION:
+            op, owner, x, y, arg = command.unpack_from(data, offset)
+        else:
+            op, x, y, arg = command.unpack_from(data, offset)
+            owner = 0
+        offset += command.size
+        if op == STATE_HASH:
+            if offset + DIGEST_SIZE > len(data):
+                break
+            arg = data[offset:offset + DIGEST_SIZE]
+            offset += DIGEST_SIZE
+        commands.append((op, owner, x, y, arg))
+    return initial, commands
+
+class Replayer:
+    """Повтор журнала с максимальной скоростью, без отрисовки.
+
+    По ходу повтора запоминаются снимки партии, поэтому переход
+    к любому ходу начинается с ближайшего снимка, а не с начала.
+    """
+
+    def __init__(self, initial, commands, snapshot_every=SNAPSHOT_EVERY):
+        self.initial = initial
+        self.commands = commands
+        self.snapshot_every = snapshot_every
+        # Ход -> (позиция в журнале, снимок партии в байтах)
+        self.snapshots = {}
+        # Несовпадения хэша: (ход, позиция в журнале)
+        self.mismatches = []
+        self.restore(0, initial)
+
+    @classmethod
+    def from_file(cls, path, snapshot_every=SNAPSHOT_EVERY):
+        initial, commands = read_log(path)
+        return cls(initial, commands, snapshot_every)
+
+    def restore(self, position, data):
+        self.world = parse_game(data)
+        self.position = position
+
+    def finished(self):
+        return self.position >= len(self.commands)
+
+    def step(self):
+        """Выполняет следующую команду журнала"""
+        op, owner, x, y, arg = self.commands[self.position]
+        self.position += 1
+        if op == STATE_HASH:
+            if state_hash(self.world) != arg:
+                self.mismatches.append((self.world.turn_count, self.position - 1))
+            return
+        apply_command(self.world, op, owner, x, y, arg)
+        turn = self.world.turn_count
+        if op == END_TURN and turn % self.snapshot_every == 0 and turn not in self.snapshots:
+            self.snapshots[turn] = (self.position, dump_game(self.world))
+
+    def run(self, until_turn=None):
+        """Повтор до конца журнала или до начала хода until_turn"""
+        while not self.finished():
+            if until_turn is not None and self.world.turn_count >= until_turn:
+                break
+            self.step()
+        return self.world
+
+    def seek(self, turn):
+        """Партия в начале хода turn (или в конце журнала, если он короче)"""
+        if self.world.turn_count > turn:
+            earlier = [t for t in self.snapshots if t <= turn]
+            if earlier:
+                self.restore(*self.snapshots[max(earlier)])
+            else:
+                self.restore(0, self.initial)
+        else:
+            later = [t for t in self.snapshots if self.world.turn_count < t <= turn]
+            if later:
+                self.restore(*self.snapshots[max(later)])
+        return self.run(until_turn=turn)
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Повтор журнала партии vektor без окна")
+    parser.add_argument("log", help="файл журнала (.vkr)")
+    parser.add_argument("--turn", type=int, help="остановиться в начале этого хода")
+    parser.add_argument("--snapshot-every", type=int, default=SNAPSHOT_EVERY, help="снимок партии каждые N ходов")
+    args = parser.parse_args(argv)
+
+    try:
+        replayer = Replayer.from_file(args.log, args.snapshot_every)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось прочитать журнал: {e}")
+        return 2
+
+    start = time.perf_counter()
+    world = replayer.run(until_turn=args.turn)
+    elapsed = time.perf_counter() - start
+
+    print(f"Команд выполнено: {replayer.position} из {len(replayer.commands)} за {elapsed * 1000:.1f} мс")
+    print(f"Ход {world.turn_count}, зданий {len(world.buildings)}, юнитов {len(world.units)}")
+    print(f"Хэш состояния: {state_hash(world).hex()}")
+    if replayer.mismatches:
+        for turn, position in replayer.mismatches:
+            print(f"Хэш не совпал: ход {turn}, команда {position}")
+        return 1
+    if any(command[0] == STATE_HASH for command in replayer.commands[:replayer.position]):
+        print("Хэш совпал с записанным")
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,286 @@
+"""Сохранение и загрузка партии в компактном двоичном формате.
+
+Файл - заголовок (размер карты и seed) и записи. Каждая запись - запасы
+фракций, номер хода и массивы (x, y, тип, владелец) зданий и
+(x, y, тип, владелец, цель x, цель y) юнитов, начиная с позиции start:
+при загрузке списки обрезаются до start и дополняются из записи. Полная
+запись начинается с 0, запись автосохранения - только новые сущности.
+Ресурсы на карте не сохраняются - они заново создаются по seed.
+"""
+import copy
+import os
+import struct
+import sys
+from array import array
+from concurrent.futures import ThreadPoolExecutor
+
+from gamelog import get_logger
+from state import GameState
+
+log = get_logger("savegame")
+
+MAGIC = b"VKSV"
+# Версия 2 - фракции: запасы каждой и владелец у зданий и юнитов,
+# версия 3 - цель движения юнита
+VERSION = 3
+HEADER = struct.Struct("<4sHIIQ")
+RECORD_SIZE = struct.Struct("<I")
+RECORD_HEAD = struct.Struct("<IHH")
+RECORD_HEAD_V1 = struct.Struct("<IH")
+SECTION_HEAD = struct.Struct("<II")
+
+# Столбцы секций: (поле, тип массива, значение для старых версий без столбца)
+BUILDING_FIELDS = [("x", "i", 0), ("y", "i", 0), ("kind", "H", 0), ("owner", "B", 0)]
+UNIT_FIELDS = BUILDING_FIELDS + [("target_x", "i", -1), ("target_y", "i", -1)]
+
+# Сколько столбцов секций записано в каждой версии: (зданий, юнитов)
+STORED_FIELDS = {1: (3, 3), 2: (4, 4), 3: (4, 6)}
+
+# После стольких добавочных записей автосохранение переписывает файл целиком
+COMPACT_EVERY = 20
+
+def get_save_dir():
+    """Папка для сохранений"""
+    if os.environ.get("VEKTOR_SAVE_DIR"):
+        return os.environ["VEKTOR_SAVE_DIR"]
+    if os.name == "nt" and os.environ.get("APPDATA"):
+        base = os.environ["APPDATA"]
+    else:
+        base = os.environ.get("XDG_DATA_HOME") or os.path.join(os.path.expanduser("~"), ".local", "share")
+    return os.path.join(base, "vektor", "saves")
+
+def to_bytes(values):
+    """Массив в байты в порядке little-endian"""
+    if sys.byteorder == "big":
+        values = array(values.typecode, values)
+        values.byteswap()
+    return values.tobytes()
+
+def from_bytes(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    if sys.byteorder == "big":
+        values.byteswap()
+    return values
+
+def entity_columns(entities, fields):
+    """По массиву на каждое поле fields"""
+    return [array(typecode, [getattr(entity, name) for entity in entities]) for name, typecode, _ in fields]
+
+def pack_columns(columns, start=0):
+    """Секция из готовых массивов: заголовок и массивы"""
+    return SECTION_HEAD.pack(start, len(columns[0])) + b"".join(map(to_bytes, columns))
+
+def pack_section(entities, start, fields):
+    """Сущности с позиции start: заголовок и по массиву на каждое поле fields"""
+    return pack_columns(entity_columns(entities, fields), start)
+
+def pack_record(turn_count, stocks, buildings, units, building_start=0, unit_start=0):
+    """Запись: запасы фракций, номер хода, здания и юниты (списки начиная с позиций *_start)"""
+    return pack_sections(
+        turn_count, stocks,
+        pack_section(buildings, building_start, BUILDING_FIELDS), pack_section(units, unit_start, UNIT_FIELDS)
+    )
+
+def pack_sections(turn_count, stocks, building_section, unit_section):
+    """Запись из запасов фракций, номера хода и готовых секций зданий и юнитов"""
+    num_resources = len(stocks[0])
+    values = array("q", [amount for stock in stocks for amount in stock])
+    payload = b"".join((
+        RECORD_HEAD.pack(turn_count, num_resources, len(stocks)),
+        to_bytes(values),
+        building_section,
+        unit_section,
+    ))
+    return RECORD_SIZE.pack(len(payload)) + payload
+
+def faction_stocks(world):
+    """Копии запасов всех фракций"""
+    return [list(faction.stock) for faction in world.factions]
+
+def pack_header(world):
+    return HEADER.pack(MAGIC, VERSION, world.width, world.height, world.seed)
+
+def write_atomic(path, data):
+    """Запись файла через временный, чтобы не оставить его наполовину записанным"""
+    os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+    tmp_path = f"{path}.{os.getpid()}.tmp"
+    with open(tmp_path, "wb") as f:
+        f.write(data)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, path)
+
+def dump_game(world):
+    """Полное сохранение партии в байтах"""
+    record = pack_record(world.turn_count, faction_stocks(world), world.buildings, world.units)
+    return pack_header(world) + record
+
+def save_game(world, path):
+    """Полное сохранение партии в файл"""
+    write_atomic(path, dump_game(world))
+
+def new_columns(fields):
+    return [array(typecode) for _, typecode, _ in fields]
+
+def read_section(data, offset, columns, fields, stored):
+    """Применяет секцию записи к массивам columns по полям fields.
+
+    В файле только первые stored столбцов, остальные (их не было
+    в старой версии) заполняются значением по умолчанию.
+    """
+    start, count = SECTION_HEAD.unpack_from(data, offset)
+    offset += SECTION_HEAD.size
+    for i, (column, (_, _, default)) in enumerate(zip(columns, fields)):
+        del column[start:]
+        if i >= stored:
+            column.extend([default] * count)
+            continue
+        size = count * column.itemsize
+        column.extend(from_bytes(column.typecode, data[offset:offset + size]))
+        offset += size
+    return offset
+
+def load_game(path):
+    """Загрузка партии; ValueError, если файл не является сохранением"""
+    with open(path, "rb") as f:
+        return parse_game(f.read(), path)
+
+def parse_game(data, path="<память>"):
+    """Партия из байтов сохранения"""
+    if len(data) < HEADER.size:
+        raise ValueError(f"{path}: слишком короткий файл")
+    magic, version, width, height, seed = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version not in STORED_FIELDS:
+        raise ValueError(f"{path}: неизвестный формат сохранения")
+
+    stocks = None
+    turn_count = 1
+    building_fields, unit_fields = STORED_FIELDS[version]
+    buildings = new_columns(BUILDING_FIELDS)
+    units = new_columns(UNIT_FIELDS)
+    offset = HEADER.size
+    while offset + RECORD_SIZE.size <= len(data):
+        (size,) = RECORD_SIZE.unpack_from(data, offset)
+        end = offset + RECORD_SIZE.size + size
+        if end > len(data):
+            # Последняя запись не дописана (игра закрылась во время записи)
+            break
+        record = memoryview(data)[offset + RECORD_SIZE.size:end]
+        if version == 1:
+            turn_count, num_resources = RECORD_HEAD_V1.unpack_from(record, 0)
+            num_factions = 1
+            pos = RECORD_HEAD_V1.size
+        else:
+            turn_count, num_resources, num_factions = RECORD_HEAD.unpack_from(record, 0)
+            pos = RECORD_HEAD.size
+        values = from_bytes("q", record[pos:pos + num_resources * num_factions * 8]).tolist()
+        stocks = [values[i:i + num_resources] for i in range(0, len(values), num_resources)]
+        pos += num_resources * num_factions * 8
+        pos = read_section(record, pos, buildings, BUILDING_FIELDS, building_fields)
+        read_section(record, pos, units, UNIT_FIELDS, unit_fields)
+        offset = end
+    if stocks is None:
+        raise ValueError(f"{path}: в сохранении нет данных")
+
+    world = GameState(width, height, seed=seed)
+    world.restore(stocks, turn_count, zip(*buildings), zip(*units))
+    return world
+
+class Snapshotter:
+    """Полные снимки партии в байтах (как dump_game), которые дешевеют от снимка к снимку.
+
+    Здания в списке партии только добавляются, поэтому их столбцы
+    хранятся между снимками и дополняются новыми зданиями - O(изменений).
+    Юниты ходят и упаковываются каждый раз целиком. Если список зданий
+    заменен (загрузка) или стал короче, столбцы собираются заново.
+    """
+
+    def __init__(self):
+        self.buildings = None
+        self.columns = new_columns(BUILDING_FIELDS)
+
+    def dump(self, world):
+        if world.buildings is not self.buildings or len(world.buildings) < len(self.columns[0]):
+            self.buildings = world.buildings
+            self.columns = new_columns(BUILDING_FIELDS)
+        start = len(self.columns[0])
+        for column, added in zip(self.columns, entity_columns(world.buildings[start:], BUILDING_FIELDS)):
+            column.extend(added)
+        record = pack_sections(
+            world.turn_count, faction_stocks(world), pack_columns(self.columns), pack_section(world.units, 0, UNIT_FIELDS)
+        )
+        return pack_header(world) + record
+
+class Autosaver:
+    """Автосохранение в фоне: в файл дописывается только новое с прошлой записи.
+
+    Записи готовятся в главном потоке (это срез списков, O(изменений)),
+    а упаковываются и пишутся на диск одним фоновым потоком по порядку.
+    Здания и юниты в списках партии только добавляются, поэтому для
+    добавочной записи достаточно запомнить их количество. Юниты еще
+    и ходят - тогда в запись попадают все юниты (по units_version).
+    Если списки стали короче или сменилась партия, файл переписывается целиком.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self.executor = ThreadPoolExecutor(max_workers=1)
+        self.saved_key = None
+        self.saved_buildings = 0
+        self.saved_units = 0
+        self.saved_units_version = None
+        self.records = 0
+        self.failed = False
+
+    def reset(self):
+        """Следующее сохранение будет полным"""
+        self.saved_key = None
+
+    def save(self, world):
+        """Ставит сохранение в очередь и сразу возвращается"""
+        key = (id(world), world.seed, world.width, world.height, len(world.factions))
+        full = (
+            self.failed or key != self.saved_key or self.records >= COMPACT_EVERY
+            or len(world.buildings) < self.saved_buildings or len(world.units) < self.saved_units
+        )
+        if full:
+            self.failed = False
+            self.saved_key = key
+            self.records = 0
+            building_start = unit_start = 0
+        else:
+            building_start = self.saved_buildings
+            unit_start = self.saved_units if world.units_version == self.saved_units_version else 0
+
+        # Копии того, что может измениться до записи в фоне
+        header = pack_header(world) if full else None
+        self.saved_buildings = len(world.buildings)
+        self.saved_units = len(world.units)
+        self.saved_units_version = world.units_version
+        self.records += 1
+        # Юниты меняются на месте - в фон уходят копии
+        units = [copy.copy(unit) for unit in world.units[unit_start:]]
+        return self.executor.submit(
+            self.write, header, world.turn_count, faction_stocks(world),
+            world.buildings[building_start:], units, building_start, unit_start
+        )
+
+    def write(self, header, turn_count, stocks, buildings, units, building_start, unit_start):
+        if header is None and self.failed:
+            # Файл не переписался - дописывать к нему нельзя, следующее сохранение будет полным
+            return
+        record = pack_record(turn_count, stocks, buildings, units, building_start, unit_start)
+        try:
+            if header is not None:
+                write_atomic(self.path, header + record)
+            else:
+                with open(self.path, "ab") as f:
+                    f.write(record)
+        except OSError as e:
+            log.error("Ошибка автосохранения %s: %s", self.path, e)
+            self.failed = True
+
+    def close(self):
+        """Дожидается записи всех сохранений"""
+        self.executor.shutdown(wait=True)
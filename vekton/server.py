@@ -0,0 +1,360 @@
+"""Сетевая партия: несколько игроков на одной карте, ходы в ногу (lockstep).
+
+Клиенты присылают только команды - постройку, найм, приказ юнитам и
+конец хода - в формате команд журнала (replay.COMMAND). Ход
+заканчивается, когда его закончили все игроки или вышло время
+TURN_TIMEOUT. Сервер выполняет команды по порядку фракций, считает ход
+по обычным правилам (GameState.end_turn) и рассылает всем одну и ту же
+посылку: принятые команды и хэш состояния после хода. Клиенты повторяют
+эти команды у себя и сверяют хэш, поэтому полное состояние передается
+только при подключении. Новые игроки входят в партию между ходами.
+
+Запуск:
+    python server.py --port 5555
+    python server.py --bots 200 --turns 20   # проверка нагрузки на localhost
+"""
+import argparse
+import asyncio
+import hashlib
+import random
+import struct
+import sys
+import time
+
+from gamelog import get_logger, setup_logging
+from replay import (
+    COMMAND, DIGEST_SIZE, ReplayLog, apply_command, state_hash,
+    BUILD, RECRUIT, MOVE, END_TURN, ADD_FACTION
+)
+from savegame import dump_game, load_game, parse_game
+from state import GameState, WORLD_SIZE
+
+log = get_logger("server")
+
+DEFAULT_PORT = 5555
+
+# Посылка сервера: тип и длина, дальше данные
+FRAME = struct.Struct("<BI")
+WELCOME = 1                       # номер фракции игрока и снимок партии
+TURN = 2                          # TURN_HEAD, команды хода, хэш состояния
+TURN_HEAD = struct.Struct("<II")  # номер хода после его конца, число команд
+PLAYER_HEAD = struct.Struct("<B")
+MAX_FRAME = 64 << 20
+
+# Команды, которые принимаются от клиента; END_TURN - готовность закончить ход
+CLIENT_COMMANDS = {BUILD, RECRUIT, MOVE}
+MAX_COMMANDS_PER_TURN = 256
+
+# Сколько ждать игроков, с
+TURN_TIMEOUT = 10.0
+# Номер фракции хранится в сохранении в одном байте
+MAX_PLAYERS = 256
+# Клиент, у которого скопилось столько неотправленных байт, отключается
+MAX_WRITE_BUFFER = 1 << 20
+
+def pack_frame(kind, payload):
+    return FRAME.pack(kind, len(payload)) + payload
+
+async def read_frame(reader):
+    kind, size = FRAME.unpack(await reader.readexactly(FRAME.size))
+    if size > MAX_FRAME:
+        raise ValueError(f"Слишком большая посылка: {size} байт")
+    return kind, await reader.readexactly(size)
+
+class Player:
+    """Подключение игрока: фракция, команды текущего хода и готовность его закончить"""
+
+    def __init__(self, writer):
+        self.writer = writer
+        self.faction = None
+        self.commands = []
+        self.ready = False
+
+class GameServer:
+    """Сервер одной партии"""
+
+    def __init__(self, world, turn_timeout=TURN_TIMEOUT, log_path=None):
+        self.world = world
+        self.turn_timeout = turn_timeout
+        self.players = []
+        # Подключились и ждут начала следующего хода
+        self.joining = []
+        self.next_faction = 0
+        self.changed = asyncio.Event()
+        self.log = ReplayLog(log_path, world) if log_path else None
+        # Время расчета и рассылки каждого хода, мс
+        self.turn_times = []
+        self.server = None
+        self.turn_task = None
+
+    async def start(self, host="127.0.0.1", port=DEFAULT_PORT):
+        """Запуск; возвращает порт (при port=0 - выбранный системой)"""
+        self.server = await asyncio.start_server(self.handle_client, host, port)
+        self.turn_task = asyncio.create_task(self.run_turns())
+        return self.server.sockets[0].getsockname()[1]
+
+    async def close(self):
+        if self.turn_task:
+            self.turn_task.cancel()
+        if self.server:
+            self.server.close()
+            await self.server.wait_closed()
+        for player in self.players + self.joining:
+            player.writer.close()
+        if self.log:
+            self.log.close(self.world)
+
+    async def handle_client(self, reader, writer):
+        player = Player(writer)
+        self.joining.append(player)
+        self.changed.set()
+        try:
+            while True:
+                op, _, x, y, arg = COMMAND.unpack(await reader.readexactly(COMMAND.size))
+                if player.faction is None:
+                    # До входа в партию команды не принимаются
+                    continue
+                if op == END_TURN:
+                    player.ready = True
+                    self.changed.set()
+                elif op in CLIENT_COMMANDS and len(player.commands) < MAX_COMMANDS_PER_TURN:
+                    player.commands.append((op, x, y, arg))
+        except (asyncio.IncompleteReadError, ConnectionError):
+            pass
+        finally:
+            self.drop(player)
+
+    def drop(self, player):
+        """Отключение игрока; его фракция остается в партии"""
+        if player in self.players:
+            self.players.remove(player)
+        elif player in self.joining:
+            self.joining.remove(player)
+        player.writer.close()
+        self.changed.set()
+
+    def turn_ready(self):
+        if self.players:
+            return all(player.ready for player in self.players)
+        return bool(self.joining)
+
+    async def run_turns(self):
+        loop = asyncio.get_running_loop()
+        while True:
+            deadline = loop.time() + self.turn_timeout
+            while not self.turn_ready():
+                self.changed.clear()
+                # Без игроков ждем подключения сколько угодно
+                timeout = max(0.0, deadline - loop.time()) if self.players else None
+                try:
+                    await asyncio.wait_for(self.changed.wait(), timeout)
+                except asyncio.TimeoutError:
+                    break
+            self.resolve_turn()
+
+    def send(self, player, frame):
+        """Посылка без ожидания клиента; кто не успевает читать - отключается"""
+        writer = player.writer
+        if writer.is_closing():
+            return
+        writer.write(frame)
+        if writer.transport.get_write_buffer_size() > MAX_WRITE_BUFFER:
+            log.warning(
+                "Игрок %d не успевает получать ходы - отключен", player.faction,
+                extra={"event": "slow_player", "data": {"faction": player.faction}}
+            )
+            writer.close()
+
+    def resolve_turn(self):
+        """Вход новых игроков, команды хода по порядку фракций, конец хода и рассылка"""
+        start = time.perf_counter()
+        world = self.world
+        commands = []
+
+        joining, self.joining = self.joining, []
+        for player in joining:
+            if self.next_faction >= MAX_PLAYERS:
+                log.warning("Сервер заполнен - игрок отключен", extra={"event": "server_full"})
+                player.writer.close()
+                continue
+            # Фракции загруженной партии занимаются по порядку, дальше - новые
+            if self.next_faction >= len(world.factions):
+                command = (ADD_FACTION, self.next_faction, 0, 0, 0)
+                apply_command(world, *command)
+                commands.append(command)
+            player.faction = self.next_faction
+            self.next_faction += 1
+
+        playing = sorted(self.players, key=lambda player: player.faction)
+        for player in playing:
+            for op, x, y, arg in player.commands:
+                if apply_command(world, op, player.faction, x, y, arg) is not None:
+                    commands.append((op, player.faction, x, y, arg))
+            player.commands = []
+            player.ready = False
+        if playing:
+            world.end_turn()
+            commands.append((END_TURN, 0, 0, 0, 0))
+
+        snapshot = dump_game(world)
+        digest = hashlib.blake2b(snapshot, digest_size=DIGEST_SIZE).digest()
+        frame = pack_frame(TURN, b"".join(
+            [TURN_HEAD.pack(world.turn_count, len(commands))] + [COMMAND.pack(*command) for command in commands] + [digest]
+        ))
+        for player in playing:
+            self.send(player, frame)
+        for player in joining:
+            if player.faction is not None:
+                self.send(player, pack_frame(WELCOME, PLAYER_HEAD.pack(player.faction) + snapshot))
+                self.players.append(player)
+
+        if self.log:
+            for op, owner, x, y, arg in commands:
+                self.log.record(op, x, y, arg, owner)
+            self.log.flush()
+        self.turn_times.append((time.perf_counter() - start) * 1000)
+
+class LockstepClient:
+    """Подключение к серверу: своя копия партии, идущая в ногу с сервером"""
+
+    def __init__(self, reader, writer, faction, world, verify=True):
+        self.reader = reader
+        self.writer = writer
+        self.faction = faction
+        self.world = world
+        # Сверять ли хэш состояния после каждого хода
+        self.verify = verify
+
+    @classmethod
+    async def connect(cls, host="127.0.0.1", port=DEFAULT_PORT, verify=True):
+        """Подключение; возвращается после входа в партию (в начале хода)"""
+        reader, writer = await asyncio.open_connection(host, port)
+        kind, payload = await read_frame(reader)
+        if kind != WELCOME:
+            writer.close()
+            raise ValueError("Сервер не прислал партию")
+        (faction,) = PLAYER_HEAD.unpack_from(payload)
+        world = parse_game(payload[PLAYER_HEAD.size:])
+        return cls(reader, writer, faction, world, verify)
+
+    def send(self, op, x=0, y=0, arg=0):
+        self.writer.write(COMMAND.pack(op, self.faction, x, y, arg))
+
+    def end_turn(self):
+        self.send(END_TURN)
+
+    async def next_turn(self):
+        """Ждет конца хода и повторяет его; список команд (код, фракция, x, y, аргумент)"""
+        kind, payload = await read_frame(self.reader)
+        if kind != TURN:
+            raise ValueError(f"Неожиданная посылка сервера: {kind}")
+        turn, count = TURN_HEAD.unpack_from(payload)
+        offset = TURN_HEAD.size
+        commands = [COMMAND.unpack_from(payload, offset + i * COMMAND.size) for i in range(count)]
+        digest = payload[offset + count * COMMAND.size:]
+        for command in commands:
+            apply_command(self.world, *command)
+        if self.verify and state_hash(self.world) != digest:
+            raise ValueError(f"Состояние разошлось с сервером на ходу {turn}")
+        return commands
+
+    async def close(self):
+        self.writer.close()
+        try:
+            await self.writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def run_bot(host, port, turns, seed):
+    """Клиент-бот: каждый ход пробует построить что-нибудь и заканчивает ход.
+
+    Возвращает задержки хода, мс: от своего конца хода до посылки сервера.
+    """
+    rng = random.Random(seed)
+    client = await LockstepClient.connect(host, port)
+    world = client.world
+    latencies = []
+    try:
+        for _ in range(turns):
+            kinds = sorted(world.affordable_buildings(client.faction))
+            if kinds:
+                kind = rng.choice(kinds)
+                cell = (rng.randrange(world.width), rng.randrange(world.height))
+                if world.can_place_building(cell, kind):
+                    client.send(BUILD, cell[0], cell[1], kind)
+            client.end_turn()
+            start = time.perf_counter()
+            await client.next_turn()
+            latencies.append((time.perf_counter() - start) * 1000)
+    finally:
+        await client.close()
+    return latencies
+
+async def load_test(world, bots, turns, turn_timeout):
+    """Сервер и bots клиентов в одном процессе на localhost.
+
+    Каждый бот ведет свою копию партии, поэтому задержка у клиентов
+    включает расчет копий всех ботов; стоимость хода для сервера -
+    отдельной строкой.
+    """
+    server = GameServer(world, turn_timeout)
+    port = await server.start("127.0.0.1", 0)
+    start = time.perf_counter()
+    results = await asyncio.gather(
+        *(run_bot("127.0.0.1", port, turns, seed) for seed in range(bots)), return_exceptions=True
+    )
+    elapsed = time.perf_counter() - start
+    await server.close()
+
+    errors = [result for result in results if isinstance(result, BaseException)]
+    latencies = sorted(ms for result in results if not isinstance(result, BaseException) for ms in result)
+    print(f"Клиентов: {bots}, ходов: {world.turn_count - 1}, время: {elapsed:.1f} с, ошибок: {len(errors)}")
+    for error in errors[:5]:
+        print(f"  {error!r}")
+    if server.turn_times:
+        print(f"Расчет хода на сервере: среднее {sum(server.turn_times) / len(server.turn_times):.1f} мс, "
+              f"максимум {max(server.turn_times):.1f} мс")
+    if latencies:
+        print(f"Задержка хода у клиента: медиана {latencies[len(latencies) // 2]:.1f} мс, "
+              f"99% {latencies[int(len(latencies) * 0.99)]:.1f} мс")
+    return 1 if errors else 0
+
+async def serve(world, host, port, turn_timeout, log_path):
+    server = GameServer(world, turn_timeout, log_path)
+    port = await server.start(host, port)
+    print(f"Сервер партии: {host}:{port}, карта {world.width}x{world.height}, seed {world.seed}")
+    try:
+        await server.server.serve_forever()
+    finally:
+        await server.close()
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Сервер сетевой партии vektor")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--size", type=int, nargs=2, default=WORLD_SIZE, metavar=("W", "H"), help="размер карты")
+    parser.add_argument("--seed", type=int, help="seed карты")
+    parser.add_argument("--load", help="продолжить партию из сохранения")
+    parser.add_argument("--log", help="записывать журнал команд партии в файл")
+    parser.add_argument("--turn-timeout", type=float, default=TURN_TIMEOUT, help="сколько ждать игроков, с")
+    parser.add_argument("--bots", type=int, help="проверка: запустить столько клиентов-ботов на localhost")
+    parser.add_argument("--turns", type=int, default=20, help="сколько ходов играют боты")
+    args = parser.parse_args(argv)
+    setup_logging()
+
+    try:
+        world = load_game(args.load) if args.load else GameState(*args.size, seed=args.seed)
+    except (OSError, ValueError) as e:
+        print(f"Не удалось загрузить партию: {e}")
+        return 2
+
+    if args.bots:
+        return asyncio.run(load_test(world, args.bots, args.turns, args.turn_timeout))
+    try:
+        asyncio.run(serve(world, args.host, args.port, args.turn_timeout, args.log))
+    except KeyboardInterrupt:
+        pass
+    return 0
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,504 @@
+"""Состояние игры без pygame: клетки карты, здания, юниты и запасы игрока.
+
+Все сущности хранят координаты клетки сетки и целочисленный тип,
+названия нужны только для отображения.
+"""
+import json
+import os
+import random
+from collections import Counter
+from dataclasses import dataclass
+
+from economy import EconomyEngine
+from pathfinding import PathFinder, nearest_free_cell, passable
+from terrain import MASK64, TerrainGenerator
+
+# Описания ресурсов, клеток, зданий и юнитов - в файле данных,
+# новые здания и ресурсы добавляются без изменения кода
+RULES_PATH = os.environ.get("VEKTOR_RULES") or os.path.join(
+    os.path.dirname(os.path.abspath(__file__)), "rules.json"
+)
+
+def load_rules(path=RULES_PATH):
+    """Описания игровых сущностей из JSON-файла"""
+    with open(path, encoding="utf-8") as f:
+        return json.load(f)
+
+RULES = load_rules()
+
+# Ресурсы игрока
+RESOURCE_NAMES = [resource["name"] for resource in RULES["resources"]]
+# Типы клеток с ресурсами на карте
+TERRAIN_NAMES = [terrain["name"] for terrain in RULES["terrain"]]
+BUILDING_NAMES = [building["name"] for building in RULES["buildings"]]
+UNIT_NAMES = [unit["name"] for unit in RULES["units"]]
+
+RESOURCE_IDS = {name: i for i, name in enumerate(RESOURCE_NAMES)}
+TERRAIN_IDS = {name: i for i, name in enumerate(TERRAIN_NAMES)}
+BUILDING_IDS = {name: i for i, name in enumerate(BUILDING_NAMES)}
+UNIT_IDS = {name: i for i, name in enumerate(UNIT_NAMES)}
+
+# Стартовые ресурсы игрока
+START_RESOURCES = {resource["name"]: resource.get("start", 0) for resource in RULES["resources"]}
+
+# Стоимость построек
+BUILDING_COSTS = {building["name"]: building.get("cost", {}) for building in RULES["buildings"]}
+
+# Потребление ресурсов зданиями каждый ход
+BUILDING_UPKEEP = {building["name"]: building["upkeep"] for building in RULES["buildings"] if building.get("upkeep")}
+
+# Производство ресурсов зданиями каждый ход
+BUILDING_PRODUCTION = {
+    building["name"]: building["production"] for building in RULES["buildings"] if building.get("production")
+}
+
+# Стоимость юнитов
+UNIT_COSTS = {unit["name"]: unit.get("cost", {}) for unit in RULES["units"]}
+
+# Сколько клеток юнит проходит за ход
+UNIT_SPEED = {unit["name"]: unit.get("speed", 1) for unit in RULES["units"]}
+
+# Здания, которые ставятся только на клетку с определенным ресурсом.
+# Остальные - только на пустую клетку.
+BUILDING_TERRAIN = {building["name"]: building["terrain"] for building in RULES["buildings"] if "terrain" in building}
+
+# Какие юниты создает здание (первый - по умолчанию)
+BUILDING_RECRUITS = {building["name"]: building["recruits"] for building in RULES["buildings"] if building.get("recruits")}
+
+@dataclass(slots=True)
+class Tile:
+    x: int
+    y: int
+    kind: int
+
+# Здания и юниты сравниваются как объекты, а не по полям: два юнита
+# в одной клетке с одним приказом - разные юниты (индекс удаляет их из списков)
+@dataclass(slots=True, eq=False)
+class Building:
+    x: int
+    y: int
+    kind: int
+    owner: int = 0
+
+@dataclass(slots=True, eq=False)
+class Unit:
+    x: int
+    y: int
+    kind: int
+    owner: int = 0
+    # Клетка, куда юнит идет (-1 - приказа нет)
+    target_x: int = -1
+    target_y: int = -1
+
+def to_vector(amounts):
+    """Словарь {название ресурса: количество} -> вектор по RESOURCE_IDS"""
+    vector = [0] * len(RESOURCE_NAMES)
+    for resource, amount in amounts.items():
+        if resource not in RESOURCE_IDS:
+            raise ValueError(f"Неизвестный ресурс в описаниях: {resource}")
+        vector[RESOURCE_IDS[resource]] = amount
+    return vector
+
+def compile_table(table, ids):
+    """Таблица {название: {ресурс: количество}} -> {id: вектор}"""
+    return {ids[name]: to_vector(amounts) for name, amounts in table.items()}
+
+class ResourceStore:
+    """Запасы игрока - вектор по RESOURCE_IDS с номером версии.
+
+    Каждое изменение увеличивает version, поэтому то, что зависит от
+    запасов (например, какие здания по карману), пересчитывается только
+    после изменения, а не при каждом запросе.
+    """
+
+    __slots__ = ("values", "version")
+
+    def __init__(self, values):
+        self.values = list(values)
+        self.version = 0
+
+    def __len__(self):
+        return len(self.values)
+
+    def __iter__(self):
+        return iter(self.values)
+
+    def __getitem__(self, i):
+        return self.values[i]
+
+    def __setitem__(self, i, amount):
+        self.values[i] = amount
+        self.version += 1
+
+    def __repr__(self):
+        return f"ResourceStore({self.values})"
+
+    def assign(self, values):
+        """Замена всех запасов"""
+        self.values = list(values)
+        self.version += 1
+
+    def changed(self):
+        """Отметка об изменении values на месте (без __setitem__)"""
+        self.version += 1
+
+# Карта генерируется, индексируется и рисуется кусками CHUNK_SIZE x CHUNK_SIZE клеток
+CHUNK_SIZE = 16
+
+def chunk_of(entity):
+    """Кусок карты, в котором стоит сущность"""
+    return (entity.x // CHUNK_SIZE, entity.y // CHUNK_SIZE)
+
+def remove_from_bucket(buckets, key, item):
+    """Удаление item из списка buckets[key]; пустой список удаляется"""
+    bucket = buckets.get(key)
+    if not bucket or item not in bucket:
+        return False
+    bucket.remove(item)
+    if not bucket:
+        del buckets[key]
+    return True
+
+class GridIndex:
+    """Индекс занятости клеток: координаты сетки -> клетка с ресурсом, здание, юниты.
+
+    Здания и юниты дополнительно разложены по кускам карты - для отрисовки
+    только видимых. version растет при каждом изменении зданий и юнитов.
+    """
+
+    def __init__(self):
+        self.tiles = {}
+        self.buildings = {}
+        self.units = {}
+        self.chunk_buildings = {}
+        self.chunk_units = {}
+        self.version = 0
+
+    def set_entities(self, buildings, units):
+        """Индекс заново по спискам зданий и юнитов"""
+        self.buildings = {}
+        self.units = {}
+        self.chunk_buildings = {}
+        self.chunk_units = {}
+        for building in buildings:
+            self.add_building(building)
+        for unit in units:
+            self.add_unit(unit)
+
+    def clear_tiles(self):
+        self.tiles.clear()
+
+    def add_tile(self, tile):
+        self.tiles[(tile.x, tile.y)] = tile
+
+    def remove_tile(self, tile):
+        self.tiles.pop((tile.x, tile.y), None)
+
+    def add_building(self, building):
+        self.buildings[(building.x, building.y)] = building
+        self.chunk_buildings.setdefault(chunk_of(building), []).append(building)
+        self.version += 1
+
+    def remove_building(self, building):
+        if self.buildings.pop((building.x, building.y), None) is not None:
+            remove_from_bucket(self.chunk_buildings, chunk_of(building), building)
+            self.version += 1
+
+    def add_unit(self, unit):
+        self.units.setdefault((unit.x, unit.y), []).append(unit)
+        self.chunk_units.setdefault(chunk_of(unit), []).append(unit)
+        self.version += 1
+
+    def remove_unit(self, unit):
+        if remove_from_bucket(self.units, (unit.x, unit.y), unit):
+            remove_from_bucket(self.chunk_units, chunk_of(unit), unit)
+            self.version += 1
+
+    def move_unit(self, unit, cell):
+        self.remove_unit(unit)
+        unit.x, unit.y = cell
+        self.add_unit(unit)
+
+    def buildings_in_chunk(self, chunk):
+        return self.chunk_buildings.get(chunk, ())
+
+    def units_in_chunk(self, chunk):
+        return self.chunk_units.get(chunk, ())
+
+    def tile_at(self, cell):
+        return self.tiles.get(cell)
+
+    def building_at(self, cell):
+        return self.buildings.get(cell)
+
+    def units_at(self, cell):
+        return self.units.get(cell, [])
+
+# Размер карты по умолчанию, в клетках
+WORLD_SIZE = (100, 100)
+
+# Номер фракции игрока; остальные фракции - компьютерные противники
+PLAYER = 0
+
+class Faction:
+    """Участник партии: запасы и экономика его зданий"""
+
+    def __init__(self, name, upkeep, production):
+        self.name = name
+        self.stock = ResourceStore(to_vector(START_RESOURCES))
+        self.economy = EconomyEngine(len(RESOURCE_NAMES), upkeep, production)
+        # Какие здания по карману - пересчитывается после изменения запасов
+        self.affordable = set()
+        self.affordable_version = None
+
+class GameState:
+    """Данные партии: фракции с запасами, карта, здания, юниты и номер хода"""
+
+    def __init__(self, width=WORLD_SIZE[0], height=WORLD_SIZE[1], seed=None):
+        # Размер карты в клетках
+        self.width = width
+        self.height = height
+        self.buildings = []
+        self.units = []
+        self.turn_count = 1
+        self.index = GridIndex()
+        self.pathfinder = PathFinder(self)
+        # Растет при каждом перемещении юнитов и приказе им (список юнитов меняется на месте)
+        self.units_version = 0
+
+        # Правила из файла данных - таблицы по целочисленным типам
+        self.building_costs = compile_table(BUILDING_COSTS, BUILDING_IDS)
+        self.unit_costs = compile_table(UNIT_COSTS, UNIT_IDS)
+        self.unit_speed = {UNIT_IDS[name]: speed for name, speed in UNIT_SPEED.items()}
+        self.building_upkeep = compile_table(BUILDING_UPKEEP, BUILDING_IDS)
+        self.building_production = compile_table(BUILDING_PRODUCTION, BUILDING_IDS)
+        self.building_terrain = {
+            BUILDING_IDS[name]: TERRAIN_IDS[terrain] for name, terrain in BUILDING_TERRAIN.items()
+        }
+        self.building_recruits = {
+            BUILDING_IDS[name]: [UNIT_IDS[unit] for unit in units] for name, units in BUILDING_RECRUITS.items()
+        }
+
+        self.factions = []
+        self.add_faction("Игрок")
+
+        # Ресурсы на карте создаются лениво, по кускам
+        self.reset_terrain(seed)
+
+    def add_faction(self, name):
+        """Новая фракция со стартовыми запасами; возвращает ее номер"""
+        self.factions.append(Faction(name, self.building_upkeep, self.building_production))
+        return len(self.factions) - 1
+
+    # Запасы и экономика игрока
+    @property
+    def stock(self):
+        return self.factions[PLAYER].stock
+
+    @property
+    def economy(self):
+        return self.factions[PLAYER].economy
+
+    @property
+    def resources(self):
+        return self.stock
+
+    @resources.setter
+    def resources(self, values):
+        self.stock.assign(values)
+
+    def get_resource(self, name, owner=PLAYER):
+        return self.factions[owner].stock[RESOURCE_IDS[name]]
+
+    def set_resource(self, name, amount, owner=PLAYER):
+        self.factions[owner].stock[RESOURCE_IDS[name]] = amount
+
+    def can_afford(self, cost, owner=PLAYER):
+        return all(have >= need for have, need in zip(self.factions[owner].stock.values, cost))
+
+    def pay(self, cost, owner=PLAYER):
+        stock = self.factions[owner].stock
+        values = stock.values
+        for i, amount in enumerate(cost):
+            values[i] -= amount
+        stock.changed()
+
+    def affordable_buildings(self, owner=PLAYER):
+        """Типы зданий, на которые хватает запасов (пересчет только после их изменения)"""
+        faction = self.factions[owner]
+        if faction.affordable_version != faction.stock.version:
+            faction.affordable = {
+                kind for kind, cost in self.building_costs.items() if self.can_afford(cost, owner)
+            }
+            faction.affordable_version = faction.stock.version
+        return faction.affordable
+
+    def can_afford_building(self, kind, owner=PLAYER):
+        return kind in self.affordable_buildings(owner)
+
+    def can_afford_unit(self, kind, owner=PLAYER):
+        cost = self.unit_costs.get(kind)
+        return cost is not None and self.can_afford(cost, owner)
+
+    def can_afford_upkeep(self, kind, owner=PLAYER):
+        upkeep = self.building_upkeep.get(kind)
+        return upkeep is None or self.can_afford(upkeep, owner)
+
+    def in_bounds(self, cell):
+        return 0 <= cell[0] < self.width and 0 <= cell[1] < self.height
+
+    def can_place_building(self, cell, kind):
+        """Клетка свободна от зданий и подходит по типу ресурса"""
+        if not self.in_bounds(cell) or self.index.building_at(cell):
+            return False
+        tile = self.tile_at(cell)
+        required = self.building_terrain.get(kind)
+        if required is None:
+            return tile is None
+        return tile is not None and tile.kind == required
+
+    def build(self, cell, kind, owner=PLAYER):
+        """Постройка здания на клетке; None, если нельзя или не хватает ресурсов"""
+        if not self.can_place_building(cell, kind) or not self.can_afford_building(kind, owner):
+            return None
+        building = Building(cell[0], cell[1], kind, owner)
+        self.buildings.append(building)
+        self.index.add_building(building)
+        self.factions[owner].economy.add_building(kind)
+        self.pay(self.building_costs[kind], owner)
+        return building
+
+    def recruit(self, cell, kind=None, owner=PLAYER):
+        """Создание юнита своим зданием на ближайшей свободной клетке (kind - тип юнита)"""
+        building = self.index.building_at(cell)
+        if building is None or building.owner != owner:
+            return None
+        kinds = self.building_recruits.get(building.kind)
+        if not kinds:
+            return None
+        if kind is None:
+            kind = kinds[0]
+        if kind not in kinds or not self.can_afford_unit(kind, owner):
+            return None
+        spawn = nearest_free_cell(self, cell)
+        if spawn is None:
+            return None
+        unit = Unit(spawn[0], spawn[1], kind, owner)
+        self.units.append(unit)
+        self.index.add_unit(unit)
+        self.pay(self.unit_costs[kind], owner)
+        return unit
+
+    def order_move(self, number, cell, owner=PLAYER):
+        """Приказ своему юниту номер number идти на клетку; None, если нельзя"""
+        if not 0 <= number < len(self.units):
+            return None
+        unit = self.units[number]
+        if unit.owner != owner or not passable(self, cell):
+            return None
+        unit.target_x, unit.target_y = cell
+        self.units_version += 1
+        return unit
+
+    def move_units(self):
+        """Юниты с приказом проходят до своей скорости клеток к цели"""
+        self.pathfinder.sync()
+        groups = Counter((unit.target_x, unit.target_y) for unit in self.units if unit.target_x >= 0)
+        changed = False
+        for unit in self.units:
+            if unit.target_x < 0:
+                continue
+            target = (unit.target_x, unit.target_y)
+            speed = self.unit_speed.get(unit.kind, 1)
+            cells = self.pathfinder.next_cells((unit.x, unit.y), target, speed, groups[target])
+            if cells:
+                self.index.move_unit(unit, cells[-1])
+            if cells is None or (unit.x, unit.y) == target:
+                # Дошел или цель стала недостижимой
+                unit.target_x = unit.target_y = -1
+            changed = True
+        if changed:
+            self.units_version += 1
+
+    def restore(self, stocks, turn_count, buildings, units):
+        """Замена запасов фракций, зданий (x, y, тип, владелец) и юнитов (..., цель x, цель y)"""
+        self.factions = []
+        for i, stock in enumerate(stocks):
+            self.add_faction("Игрок" if i == PLAYER else f"Противник {i}")
+            self.factions[i].stock.assign(stock)
+        self.turn_count = turn_count
+        self.buildings = [Building(x, y, kind, owner) for x, y, kind, owner in buildings]
+        self.units = [Unit(*fields) for fields in units]
+        self.units_version += 1
+
+        self.index.set_entities(self.buildings, self.units)
+        self.pathfinder.clear()
+        for owner, faction in enumerate(self.factions):
+            faction.economy.rebuild(b.kind for b in self.buildings if b.owner == owner)
+
+    def reset_terrain(self, seed=None):
+        """Новая карта ресурсов для seed (случайного, если не задан).
+
+        seed приводится к 64 битам, как его и так берет генератор ресурсов:
+        карта та же, а seed помещается в заголовок сохранения.
+        """
+        self.seed = seed & MASK64 if seed is not None else random.randrange(2 ** 32)
+        self.terrain = TerrainGenerator(self.seed, len(TERRAIN_NAMES))
+        self.generated_chunks = set()
+        self.tiles = []
+        self.index.clear_tiles()
+
+    def ensure_chunk(self, chunk_x, chunk_y):
+        """Создает ресурсы куска карты, если он еще не создан"""
+        key = (chunk_x, chunk_y)
+        if key in self.generated_chunks:
+            return
+        self.generated_chunks.add(key)
+
+        # Крайние клетки карты остаются пустыми
+        max_x = self.width - 2
+        max_y = self.height - 2
+        for x, y, kind in self.terrain.generate_chunk(chunk_x, chunk_y, CHUNK_SIZE):
+            if 1 <= x <= max_x and 1 <= y <= max_y:
+                tile = Tile(x, y, kind)
+                self.tiles.append(tile)
+                self.index.add_tile(tile)
+
+    def generate_all(self):
+        """Создает все куски карты сразу (для замеров и сохранения)"""
+        for chunk_y in range((self.height + CHUNK_SIZE - 1) // CHUNK_SIZE):
+            for chunk_x in range((self.width + CHUNK_SIZE - 1) // CHUNK_SIZE):
+                self.ensure_chunk(chunk_x, chunk_y)
+
+    def tile_at(self, cell):
+        """Клетка с ресурсом (кусок карты создается при первом обращении)"""
+        if self.in_bounds(cell):
+            self.ensure_chunk(cell[0] // CHUNK_SIZE, cell[1] // CHUNK_SIZE)
+        return self.index.tile_at(cell)
+
+    def end_turn(self):
+        """Содержание и производство зданий всех фракций, движение юнитов.
+
+        Возвращает отчет игрока {тип: (оплачено, не хватило)}.
+        """
+        # Порядок постройки нужен только фракциям, которым не хватило на содержание.
+        # Здания раскладываются по фракциям одним проходом при первом обращении.
+        grouped = []
+
+        def ordered_kinds(owner):
+            if len(self.factions) == 1:
+                yield from (building.kind for building in self.buildings)
+                return
+            if not grouped:
+                grouped.extend([] for _ in self.factions)
+                for building in self.buildings:
+                    grouped[building.owner].append(building.kind)
+            yield from grouped[owner]
+
+        reports = []
+        for owner, faction in enumerate(self.factions):
+            reports.append(faction.economy.resolve_turn(faction.stock.values, ordered_kinds(owner)))
+            faction.stock.changed()
+        self.move_units()
+        self.turn_count += 1
+        return reports[PLAYER]
@@ -0,0 +1,98 @@
+"""Процедурная генерация ресурсов на карте по зерну (seed).
+
+Результат для куска карты зависит только от (seed, координаты куска),
+поэтому куски можно создавать лениво и в любом порядке - карта всегда
+получится одинаковой. Месторождения собираются в скопления за счет
+шума значений (value noise), а не разбрасываются равномерно.
+"""
+
+MASK64 = (1 << 64) - 1
+
+# Номера каналов шума, чтобы поля разных назначений не совпадали
+RICHNESS_CHANNEL = 0
+SCATTER_CHANNEL = 1
+KIND_CHANNEL = 2
+
+def mix(*values):
+    """Детерминированный 64-битный хэш набора целых чисел (splitmix64)"""
+    h = 0x9E3779B97F4A7C15
+    for value in values:
+        h ^= value & MASK64
+        h = (h * 0xBF58476D1CE4E5B9) & MASK64
+        h ^= h >> 31
+    h = (h * 0x94D049BB133111EB) & MASK64
+    h ^= h >> 29
+    return h
+
+def hash01(*values):
+    """Псевдослучайное число в [0, 1) для набора целых чисел"""
+    return mix(*values) / 18446744073709551616.0
+
+def smoothstep(t):
+    return t * t * (3 - 2 * t)
+
+class TerrainGenerator:
+    """Ресурсы на карте: скопления месторождений, одинаковые для одного seed"""
+
+    def __init__(self, seed, num_kinds, density=0.5, deposit_scale=12, kind_scale=6):
+        self.seed = seed
+        self.num_kinds = num_kinds
+        # Средняя доля клеток с ресурсами
+        self.density = density
+        # Размеры скоплений и пятен одного типа ресурса, в клетках
+        self.deposit_scale = deposit_scale
+        self.kind_scale = kind_scale
+
+    def noise_grid(self, channel, scale, first_x, first_y, width, height):
+        """Шум значений в [0, 1) для прямоугольника клеток.
+
+        Значения в узлах решетки считаются один раз на прямоугольник,
+        внутри - сглаженная билинейная интерполяция.
+        """
+        lattice = {}
+
+        def corner(lx, ly):
+            value = lattice.get((lx, ly))
+            if value is None:
+                value = hash01(self.seed, channel, lx, ly)
+                lattice[(lx, ly)] = value
+            return value
+
+        rows = []
+        for y in range(first_y, first_y + height):
+            ly, ry = divmod(y, scale)
+            ty = smoothstep(ry / scale)
+            row = []
+            for x in range(first_x, first_x + width):
+                lx, rx = divmod(x, scale)
+                tx = smoothstep(rx / scale)
+                top = corner(lx, ly) + (corner(lx + 1, ly) - corner(lx, ly)) * tx
+                bottom = corner(lx, ly + 1) + (corner(lx + 1, ly + 1) - corner(lx, ly + 1)) * tx
+                row.append(top + (bottom - top) * ty)
+            rows.append(row)
+        return rows
+
+    def generate_area(self, first_x, first_y, width, height):
+        """Клетки с ресурсами в прямоугольнике: список (x, y, тип)"""
+        richness = self.noise_grid(RICHNESS_CHANNEL, self.deposit_scale, first_x, first_y, width, height)
+        kinds = [
+            self.noise_grid(KIND_CHANNEL + kind, self.kind_scale, first_x, first_y, width, height)
+            for kind in range(self.num_kinds)
+        ]
+
+        tiles = []
+        for j in range(height):
+            y = first_y + j
+            for i in range(width):
+                x = first_x + i
+                # Вероятность ресурса выше в "богатых" местах, в среднем - density
+                chance = min(1.0, 2 * self.density * richness[j][i])
+                if hash01(self.seed, SCATTER_CHANNEL, x, y) >= chance:
+                    continue
+                best_kind = max(range(self.num_kinds), key=lambda kind: kinds[kind][j][i])
+                tiles.append((x, y, best_kind))
+        return tiles
+
+    def generate_chunk(self, chunk_x, chunk_y, chunk_size):
+        """Клетки с ресурсами одного куска карты"""
+        return self.generate_area(chunk_x * chunk_size, chunk_y * chunk_size, chunk_size, chunk_size)
@@ -0,0 +1,48 @@
+"""Проверки модели партии без окна.
+
+Запуск из папки vekton:
+    python -m unittest test_state
+"""
+import unittest
+
+from state import GameState, Unit, chunk_of
+
+def index_cells(world):
+    """Юниты индекса по клеткам и кускам карты - как id объектов"""
+    cells = {cell: sorted(map(id, units)) for cell, units in world.index.units.items()}
+    chunks = {chunk: sorted(map(id, units)) for chunk, units in world.index.chunk_units.items()}
+    return cells, chunks
+
+def expected_cells(world):
+    """То же, посчитанное заново по списку юнитов"""
+    cells, chunks = {}, {}
+    for unit in world.units:
+        cells.setdefault((unit.x, unit.y), []).append(id(unit))
+        chunks.setdefault(chunk_of(unit), []).append(id(unit))
+    return {k: sorted(v) for k, v in cells.items()}, {k: sorted(v) for k, v in chunks.items()}
+
+class GridIndexTest(unittest.TestCase):
+    def test_units_stack_and_split(self):
+        """Юниты с одинаковыми полями сходятся в клетку и расходятся - индекс не путает их"""
+        world = GameState(100, 100, seed=1)
+        world.units += [Unit(22, 5, 0), Unit(25, 5, 0), Unit(25, 8, 0)]
+        world.index.set_entities(world.buildings, world.units)
+
+        # Все трое приходят в одну клетку, в ее списке - в другом порядке, чем в партии
+        for number in (0, 2):
+            self.assertIsNotNone(world.order_move(number, (25, 5)))
+        for _ in range(3):
+            world.end_turn()
+        self.assertEqual({(unit.x, unit.y) for unit in world.units}, {(25, 5)})
+        self.assertEqual(index_cells(world), expected_cells(world))
+
+        # Одинаковые юниты расходятся по разным целям
+        for number, target in enumerate([(35, 20), (35, 20), (10, 40)]):
+            self.assertIsNotNone(world.order_move(number, target))
+        for _ in range(10):
+            world.end_turn()
+            self.assertEqual(index_cells(world), expected_cells(world))
+        self.assertEqual(len(world.index.units_at((25, 5))), 0)
+
+if __name__ == "__main__":
+    unittest.main()